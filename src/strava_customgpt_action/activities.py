@@ -4,25 +4,35 @@ Activity retrieval helpers built on top of stravalib.
 
 from __future__ import annotations
 
-from collections.abc import Iterable
+from collections.abc import Iterable, Iterator
+from datetime import UTC, datetime
+from itertools import islice
 
+from stravalib.client import Client
 from stravalib.exc import AccessUnauthorized
-from stravalib.model import SummaryActivity
+from stravalib.model import Stream, SummaryActivity
 
 from .auth import get_authenticated_client
 
+# Strava's page size for activity listings.
+SYNC_PAGE_SIZE = 200
+HISTORY_START = datetime(1970, 1, 1, tzinfo=UTC)
 
-def fetch_recent_activities(limit: int = 3) -> list[SummaryActivity]:
+
+def fetch_recent_activities(
+    limit: int = 3, client: Client | None = None
+) -> list[SummaryActivity]:
     """
     Fetch the most recent activities for the authenticated athlete.
 
     Args:
         limit: Maximum number of activities to retrieve.
+        client: Already authenticated client to reuse; resolved when omitted.
 
     Returns:
         A list of stravalib activity objects.
     """
-    client = get_authenticated_client()
+    client = client or get_authenticated_client()
 
     try:
         activities: Iterable[SummaryActivity] = client.get_activities(limit=limit)
@@ -32,3 +42,64 @@ def fetch_recent_activities(limit: int = 3) -> list[SummaryActivity]:
         ) from exc
 
     return list(activities)
+
+
+def fetch_activity_streams(
+    activity_id: int,
+    types: Iterable[str] | None = None,
+    client: Client | None = None,
+) -> dict[str, Stream]:
+    """
+    Fetch the raw data streams (time, distance, heart rate, ...) of an activity.
+
+    Args:
+        activity_id: Strava identifier of the activity.
+        types: Stream types to request; Strava returns only those recorded.
+        client: Already authenticated client to reuse; resolved when omitted.
+
+    Returns:
+        A mapping from stream type to stravalib stream object.
+    """
+    client = client or get_authenticated_client()
+
+    try:
+        streams = client.get_activity_streams(
+            activity_id, types=list(types) if types is not None else None
+        )
+    except AccessUnauthorized as exc:
+        raise RuntimeError(
+            "Authentication with Strava failed; refresh the access token."
+        ) from exc
+
+    return dict(streams or {})
+
+
+def iter_activity_pages(
+    after: datetime | None = None,
+    page_size: int = SYNC_PAGE_SIZE,
+    client: Client | None = None,
+) -> Iterator[list[SummaryActivity]]:
+    """
+    Yield every activity started after ``after`` (the whole history when
+    omitted), oldest first, in lists following Strava's pagination.
+
+    Args:
+        after: Only return activities that started after this instant.
+        page_size: Maximum number of activities per yielded list.
+        client: Already authenticated client to reuse; resolved when omitted.
+
+    Yields:
+        Lists of stravalib activity objects, so callers can persist progress
+        before a later page fails.
+    """
+    client = client or get_authenticated_client()
+
+    try:
+        # Strava only sorts oldest first when ``after`` is given.
+        activities = iter(client.get_activities(after=after or HISTORY_START))
+        while page := list(islice(activities, page_size)):
+            yield page
+    except AccessUnauthorized as exc:
+        raise RuntimeError(
+            "Authentication with Strava failed; refresh the access token."
+        ) from exc
@@ -0,0 +1,343 @@
+"""
+Admission control for the REST API: per-client rate limits and a global
+in-flight cap with a bounded priority queue.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import heapq
+import itertools
+import json
+import math
+import os
+import re
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+from urllib.parse import parse_qs
+
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+PRIORITY_CHEAP = 0
+PRIORITY_STRAVA = 1
+# Routes answered from local state (indexes, docs); everything else may call Strava.
+CHEAP_PATHS = re.compile(
+    r"^/(docs|redoc|openapi\.json|activities/near|activities/\d+/similar)/?$"
+)
+# Readiness probes must keep answering while the instance sheds load.
+EXEMPT_PATHS = frozenset({"/health"})
+MAX_TRACKED_CLIENTS = 10_000
+# Batch bodies are inspected to price their Strava calls; larger ones are not
+# read ahead and are charged a full bucket.
+MAX_INSPECTED_BODY_BYTES = 64 * 1024
+
+
+@dataclass(frozen=True)
+class AdmissionConfig:
+    """
+    Limits applied by ``AdmissionControlMiddleware``.
+    """
+
+    rate_per_second: float = 5.0
+    burst: float = 20.0
+    max_in_flight: int = 8
+    queue_size: int = 32
+    queue_timeout_s: float = 2.0
+    # API keys whose callers get their own bucket; any other caller is keyed by IP.
+    api_keys: frozenset[str] = frozenset()
+
+    @classmethod
+    def from_env(cls) -> AdmissionConfig:
+        defaults = cls()
+        return cls(
+            rate_per_second=float(
+                os.getenv("API_RATE_PER_SECOND", str(defaults.rate_per_second))
+            ),
+            burst=float(os.getenv("API_RATE_BURST", str(defaults.burst))),
+            max_in_flight=int(
+                os.getenv("API_MAX_IN_FLIGHT", str(defaults.max_in_flight))
+            ),
+            queue_size=int(os.getenv("API_QUEUE_SIZE", str(defaults.queue_size))),
+            queue_timeout_s=float(
+                os.getenv("API_QUEUE_TIMEOUT_S", str(defaults.queue_timeout_s))
+            ),
+            api_keys=frozenset(
+                key.strip()
+                for key in os.getenv("API_KEYS", "").split(",")
+                if key.strip()
+            ),
+        )
+
+
+class TokenBucketLimiter:
+    """
+    Per-key token buckets refilled continuously at ``rate`` tokens per second.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        burst: float,
+        clock: Callable[[], float] = time.monotonic,
+        max_clients: int = MAX_TRACKED_CLIENTS,
+    ) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._clock = clock
+        self._buckets: dict[str, tuple[float, float]] = {}
+
+    def consume(self, key: str, cost: float = 1.0) -> float:
+        """
+        Take ``cost`` tokens from the key's bucket.
+
+        A request costing more than ``burst`` is admitted once the bucket is
+        full and leaves it in debt, so its cost is still paid in full.
+
+        Returns:
+            ``0.0`` when admitted, otherwise the seconds until enough tokens
+            will have accumulated.
+        """
+        now = self._clock()
+        tokens, updated = self._buckets.get(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        needed = min(cost, self.burst)
+        if tokens < needed:
+            self._buckets[key] = (tokens, now)
+            return (needed - tokens) / self.rate if self.rate > 0 else math.inf
+        self._buckets[key] = (tokens - cost, now)
+        if len(self._buckets) > self.max_clients:
+            self._evict_idle(now)
+        return 0.0
+
+    def _evict_idle(self, now: float) -> None:
+        # Buckets that have refilled completely carry no state worth keeping;
+        # if that is not enough, drop the least recently created ones. Trimming
+        # below the cap keeps the scan amortized instead of per request.
+        idle = [
+            key
+            for key, (tokens, updated) in self._buckets.items()
+            if tokens + (now - updated) * self.rate >= self.burst
+        ]
+        for key in idle:
+            del self._buckets[key]
+        excess = len(self._buckets) - int(self.max_clients * 0.9)
+        if excess > 0:
+            for key in list(itertools.islice(self._buckets, excess)):
+                del self._buckets[key]
+
+
+class AdmissionGate:
+    """
+    Global concurrency cap; excess requests wait in a bounded priority queue
+    where lower priority values are admitted first.
+    """
+
+    def __init__(self, max_in_flight: int, queue_size: int) -> None:
+        self.max_in_flight = max_in_flight
+        self.queue_size = queue_size
+        self.in_flight = 0
+        self._waiters: list[tuple[int, int, asyncio.Future[bool]]] = []
+        self._sequence = itertools.count()
+
+    async def acquire(self, priority: int, timeout: float) -> bool:
+        """
+        Wait for a slot; returns ``False`` if the queue is full, the request
+        was displaced by a higher-priority one, or ``timeout`` elapsed.
+        """
+        if self.in_flight < self.max_in_flight and not self._waiters:
+            self.in_flight += 1
+            return True
+
+        if len(self._waiters) >= self.queue_size:
+            if not self._waiters:
+                # Queueing is disabled: nothing to displace, reject outright.
+                return False
+            worst = max(self._waiters)
+            if priority >= worst[0]:
+                return False
+            self._discard(worst)
+            worst[2].set_result(False)
+
+        waiter: asyncio.Future[bool] = asyncio.get_running_loop().create_future()
+        entry = (priority, next(self._sequence), waiter)
+        heapq.heappush(self._waiters, entry)
+        try:
+            return await asyncio.wait_for(asyncio.shield(waiter), timeout)
+        except TimeoutError:
+            if waiter.done():
+                # A slot was handed over just as the timeout fired.
+                return waiter.result()
+            self._discard(entry)
+            waiter.cancel()
+            return False
+        except asyncio.CancelledError:
+            # The client went away while queued; never leak a handed-over slot.
+            if waiter.done() and waiter.result():
+                self.release()
+            elif not waiter.done():
+                self._discard(entry)
+                waiter.cancel()
+            raise
+
+    def release(self) -> None:
+        """
+        Hand the freed slot to the best waiter, or return it to the pool.
+        """
+        while self._waiters:
+            _, _, waiter = heapq.heappop(self._waiters)
+            if not waiter.done():
+                waiter.set_result(True)
+                return
+        self.in_flight -= 1
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def _discard(self, entry: tuple[int, int, asyncio.Future[bool]]) -> None:
+        self._waiters.remove(entry)
+        heapq.heapify(self._waiters)
+
+
+class AdmissionControlMiddleware:
+    """
+    ASGI middleware rejecting excess load with ``429`` and ``Retry-After``
+    instead of letting it pile up in the threadpool.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        config: AdmissionConfig | None = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.app = app
+        self.config = config or AdmissionConfig()
+        self.limiter = TokenBucketLimiter(
+            self.config.rate_per_second, self.config.burst, clock=clock
+        )
+        self.gate = AdmissionGate(self.config.max_in_flight, self.config.queue_size)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope.get("path") in EXEMPT_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        body: bytes | None = b""
+        if scope.get("method") == "POST" and scope.get("path") == "/batch":
+            body, receive = await _buffer_body(receive)
+        cost = request_cost(scope, body) if body is not None else self.config.burst
+        wait = self.limiter.consume(client_key(scope, self.config.api_keys), cost)
+        if wait > 0:
+            await _reject(scope, receive, send, "Rate limit exceeded.", wait)
+            return
+
+        priority = request_priority(scope)
+        if not await self.gate.acquire(priority, self.config.queue_timeout_s):
+            await _reject(
+                scope,
+                receive,
+                send,
+                "Server is busy; too many requests in flight.",
+                self.config.queue_timeout_s,
+            )
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.gate.release()
+
+
+def client_key(scope: Scope, api_keys: frozenset[str] = frozenset()) -> str:
+    """
+    Identify the caller by API key when it is one of ``api_keys``, else by IP.
+
+    Unverified headers are ignored: otherwise a client could rotate them to
+    obtain a fresh bucket on every request.
+    """
+    headers = dict(scope.get("headers") or [])
+    api_key = headers.get(b"x-api-key", b"").decode("latin-1")
+    if api_key and api_key in api_keys:
+        return "key:" + hashlib.sha256(api_key.encode()).hexdigest()[:16]
+    client = scope.get("client")
+    return f"ip:{client[0]}" if client else "ip:unknown"
+
+
+def request_cost(scope: Scope, body: bytes = b"") -> float:
+    """
+    Tokens charged for a request: one per Strava call it can make, at least one.
+
+    Only activity ids asked for analytics are counted, as each may need its
+    own stream download; listing activities is a single call.
+    """
+    path = scope.get("path", "")
+    if path == "/activities/analytics":
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        return float(max(1, len(set(query.get("ids", [])))))
+    if path == "/batch":
+        return float(max(1, _batch_strava_calls(body)))
+    return 1.0
+
+
+def request_priority(scope: Scope) -> int:
+    if CHEAP_PATHS.match(scope.get("path", "")):
+        return PRIORITY_CHEAP
+    return PRIORITY_STRAVA
+
+
+def _batch_strava_calls(body: bytes) -> int:
+    try:
+        queries = json.loads(body)["queries"]
+        stream_ids = {
+            int(aid)
+            for q in queries
+            if q.get("type") == "analytics"
+            for aid in q.get("ids", [])
+        }
+        listing = any(q.get("type") == "activities" for q in queries)
+    except (ValueError, TypeError, KeyError, AttributeError):
+        # Malformed batches are rejected by validation before reaching Strava.
+        return 0
+    return len(stream_ids) + int(listing)
+
+
+async def _buffer_body(receive: Receive) -> tuple[bytes | None, Receive]:
+    """
+    Read the request body ahead of the app and return a ``receive`` replaying it.
+
+    The body is ``None`` when it exceeds ``MAX_INSPECTED_BODY_BYTES``; the rest
+    is then left for the app to read.
+    """
+    messages: list[Message] = []
+    size = 0
+    while True:
+        message = await receive()
+        messages.append(message)
+        if message["type"] != "http.request":
+            break
+        size += len(message.get("body", b""))
+        if not message.get("more_body", False) or size > MAX_INSPECTED_BODY_BYTES:
+            break
+
+    async def replay() -> Message:
+        return messages.pop(0) if messages else await receive()
+
+    if size > MAX_INSPECTED_BODY_BYTES:
+        return None, replay
+    return b"".join(m.get("body", b"") for m in messages), replay
+
+
+async def _reject(
+    scope: Scope, receive: Receive, send: Send, detail: str, retry_after: float
+) -> None:
+    response = JSONResponse(
+        {"detail": detail},
+        status_code=429,
+        headers={"Retry-After": str(max(1, math.ceil(min(retry_after, 3600))))},
+    )
+    await response(scope, receive, send)
@@ -0,0 +1,334 @@
+"""
+Zone and split analytics computed from Strava activity streams.
+"""
+
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from collections.abc import Iterable, Mapping, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+from typing import TYPE_CHECKING, Any
+
+import numpy as np
+
+from .activities import fetch_activity_streams
+
+if TYPE_CHECKING:
+    from stravalib.client import Client
+
+STREAM_TYPES = ("time", "distance", "moving", "heartrate", "watts")
+# Longest gap credited to a single sample when no ``moving`` stream is available.
+MAX_SAMPLE_GAP_S = 30.0
+# Upper bounds (exclusive) of every zone but the last, i.e. N bounds -> N+1 zones.
+DEFAULT_HR_ZONES: tuple[float, ...] = (120.0, 140.0, 155.0, 170.0)
+DEFAULT_POWER_ZONES: tuple[float, ...] = (150.0, 200.0, 240.0, 280.0, 330.0, 400.0)
+SPLIT_UNITS = {"km": 1000.0, "mi": 1609.344}
+CACHE_MAX_ENTRIES = 512
+STREAM_FETCH_WORKERS = 4
+
+
+@dataclass(frozen=True)
+class ZoneConfig:
+    """
+    Zone thresholds and split length used to analyse an activity.
+    """
+
+    heart_rate: tuple[float, ...] = DEFAULT_HR_ZONES
+    power: tuple[float, ...] = DEFAULT_POWER_ZONES
+    split_unit: str = "km"
+
+    def __post_init__(self) -> None:
+        if self.split_unit not in SPLIT_UNITS:
+            raise ValueError(f"Unsupported split unit {self.split_unit!r}.")
+        for name, bounds in (("heart_rate", self.heart_rate), ("power", self.power)):
+            if any(lo >= hi for lo, hi in zip(bounds, bounds[1:], strict=False)):
+                raise ValueError(f"{name} zone bounds must be strictly increasing.")
+
+    @property
+    def split_m(self) -> float:
+        return SPLIT_UNITS[self.split_unit]
+
+
+@dataclass
+class Split:
+    index: int
+    distance_m: float
+    elapsed_time_s: float
+    average_heartrate: float | None = None
+    average_watts: float | None = None
+
+
+@dataclass
+class ActivityAnalytics:
+    """
+    Derived training metrics for a single activity.
+    """
+
+    activity_id: int
+    hr_zone_seconds: list[float] | None
+    power_zone_seconds: list[float] | None
+    splits: list[Split] = field(default_factory=list)
+
+
+_cache: OrderedDict[tuple[int, ZoneConfig], ActivityAnalytics] = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def get_activity_analytics(
+    activity_ids: Sequence[int],
+    config: ZoneConfig | None = None,
+    client: Client | None = None,
+) -> list[ActivityAnalytics]:
+    """
+    Return analytics for the given activities, fetching streams (concurrently)
+    only for activities not already memoized under the same zone configuration.
+
+    Args:
+        activity_ids: Strava identifiers of the activities to analyse.
+        config: Zone thresholds and split length; defaults to ``ZoneConfig()``.
+        client: Already authenticated client used for any stream fetches.
+
+    Returns:
+        One ``ActivityAnalytics`` per requested id, in request order.
+    """
+    config = config or ZoneConfig()
+    results = cached_analytics(activity_ids, config)
+
+    missing = [aid for aid in dict.fromkeys(activity_ids) if aid not in results]
+    if len(missing) == 1:
+        streams = {missing[0]: load_streams(missing[0], client=client)}
+    elif missing:
+        workers = min(STREAM_FETCH_WORKERS, len(missing))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            loaded = pool.map(partial(load_streams, client=client), missing)
+            streams = dict(zip(missing, loaded, strict=True))
+    else:
+        streams = {}
+    for item in analyse_streams(streams, config):
+        results[item.activity_id] = item
+
+    return [results[aid] for aid in activity_ids]
+
+
+def cached_analytics(
+    activity_ids: Iterable[int], config: ZoneConfig
+) -> dict[int, ActivityAnalytics]:
+    """
+    Return the memoized analytics available for ``activity_ids`` under ``config``.
+    """
+    found: dict[int, ActivityAnalytics] = {}
+    with _cache_lock:
+        for activity_id in activity_ids:
+            cached = _cache.get((activity_id, config))
+            if cached is not None:
+                _cache.move_to_end((activity_id, config))
+                found[activity_id] = cached
+    return found
+
+
+def load_streams(
+    activity_id: int, client: Client | None = None
+) -> dict[str, np.ndarray]:
+    """
+    Fetch an activity's streams from Strava as float arrays (``None`` -> NaN).
+    """
+    return _streams_to_arrays(
+        fetch_activity_streams(activity_id, STREAM_TYPES, client=client)
+    )
+
+
+def analyse_streams(
+    streams_by_activity: Mapping[int, Mapping[str, np.ndarray]], config: ZoneConfig
+) -> list[ActivityAnalytics]:
+    """
+    Compute analytics for already loaded streams and memoize them.
+    """
+    if not streams_by_activity:
+        return []
+    computed = compute_analytics_batch(streams_by_activity, config)
+    with _cache_lock:
+        for item in computed:
+            _cache[(item.activity_id, config)] = item
+        while len(_cache) > CACHE_MAX_ENTRIES:
+            _cache.popitem(last=False)
+    return computed
+
+
+def clear_analytics_cache() -> None:
+    with _cache_lock:
+        _cache.clear()
+
+
+def compute_analytics_batch(
+    streams_by_activity: Mapping[int, Mapping[str, np.ndarray]], config: ZoneConfig
+) -> list[ActivityAnalytics]:
+    """
+    Compute zone distributions and splits for many activities at once.
+
+    Zone histograms for all activities are produced by a single weighted
+    ``bincount`` over the concatenated streams.
+    """
+    ids = list(streams_by_activity)
+    dts = {aid: _sample_durations(streams_by_activity[aid]) for aid in ids}
+    hr_zones = _batch_time_in_zones(
+        streams_by_activity, dts, "heartrate", config.heart_rate
+    )
+    power_zones = _batch_time_in_zones(streams_by_activity, dts, "watts", config.power)
+
+    return [
+        ActivityAnalytics(
+            activity_id=aid,
+            hr_zone_seconds=hr_zones.get(aid),
+            power_zone_seconds=power_zones.get(aid),
+            splits=compute_splits(streams_by_activity[aid], dts[aid], config.split_m),
+        )
+        for aid in ids
+    ]
+
+
+def compute_splits(
+    streams: Mapping[str, np.ndarray], dt: np.ndarray, split_m: float
+) -> list[Split]:
+    """
+    Split an activity into fixed-distance segments (the last one may be partial).
+    """
+    time = streams.get("time")
+    distance = streams.get("distance")
+    if time is None or distance is None or distance.size < 2:
+        return []
+    distance = _monotonic(distance)
+    if distance is None:
+        return []
+
+    total = float(distance[-1] - distance[0])
+    if total <= 0:
+        return []
+    full_splits = int(total // split_m)
+    boundaries = distance[0] + split_m * np.arange(1, full_splits + 1)
+    edges_t = np.concatenate(
+        ([time[0]], np.interp(boundaries, distance, time), [time[-1]])
+    )
+    edges_d = np.concatenate(([distance[0]], boundaries, [distance[-1]]))
+    durations = np.diff(edges_t)
+    lengths = np.diff(edges_d)
+    if lengths[-1] <= 0:
+        durations, lengths = durations[:-1], lengths[:-1]
+
+    count = lengths.size
+    index = np.minimum(
+        ((distance - distance[0]) // split_m).astype(np.int64), count - 1
+    )
+    averages = {
+        name: _weighted_means(index, streams[name], dt, count)
+        for name in ("heartrate", "watts")
+        if name in streams
+    }
+
+    return [
+        Split(
+            index=i + 1,
+            distance_m=float(lengths[i]),
+            elapsed_time_s=float(durations[i]),
+            average_heartrate=(
+                _nan_to_none(averages["heartrate"][i])
+                if "heartrate" in averages
+                else None
+            ),
+            average_watts=(
+                _nan_to_none(averages["watts"][i]) if "watts" in averages else None
+            ),
+        )
+        for i in range(count)
+    ]
+
+
+def _batch_time_in_zones(
+    streams_by_activity: Mapping[int, Mapping[str, np.ndarray]],
+    dts: Mapping[int, np.ndarray],
+    stream_name: str,
+    bounds: tuple[float, ...],
+) -> dict[int, list[float]]:
+    ids = [aid for aid, s in streams_by_activity.items() if stream_name in s]
+    if not ids:
+        return {}
+
+    values = np.concatenate([streams_by_activity[aid][stream_name] for aid in ids])
+    weights = np.concatenate([dts[aid] for aid in ids])
+    owners = np.repeat(
+        np.arange(len(ids)),
+        [streams_by_activity[aid][stream_name].size for aid in ids],
+    )
+    zone_count = len(bounds) + 1
+    zones = np.searchsorted(np.asarray(bounds, dtype=float), values, side="right")
+    totals = np.bincount(
+        owners * zone_count + zones,
+        weights=np.where(np.isnan(values), 0.0, weights),
+        minlength=len(ids) * zone_count,
+    ).reshape(len(ids), zone_count)
+
+    return {aid: totals[row].tolist() for row, aid in enumerate(ids)}
+
+
+def _sample_durations(streams: Mapping[str, np.ndarray]) -> np.ndarray:
+    """
+    Seconds attributed to each sample: the gap until the next sample, zeroed
+    while paused (Strava's ``time`` stream includes stops).
+    """
+    time = streams.get("time")
+    if time is None or time.size == 0:
+        size = max((s.size for s in streams.values()), default=0)
+        return np.zeros(size)
+
+    dt = np.nan_to_num(np.diff(time, append=time[-1]), nan=0.0)
+    dt = np.maximum(dt, 0.0)
+    moving = streams.get("moving")
+    if moving is not None and moving.size == time.size:
+        # ``moving[i]`` describes the interval ending at sample ``i``.
+        dt = np.where(np.append(moving[1:], 0.0) > 0, dt, 0.0)
+    else:
+        dt = np.minimum(dt, MAX_SAMPLE_GAP_S)
+    return dt
+
+
+def _monotonic(distance: np.ndarray) -> np.ndarray | None:
+    """
+    Forward-fill missing distance samples and drop GPS jitter going backwards.
+    """
+    valid = ~np.isnan(distance)
+    if not valid.any():
+        return None
+    last_valid = np.maximum.accumulate(np.where(valid, np.arange(distance.size), 0))
+    filled = distance[last_valid]
+    filled[: np.argmax(valid)] = distance[np.argmax(valid)]
+    return np.maximum.accumulate(filled)
+
+
+def _weighted_means(
+    index: np.ndarray, values: np.ndarray, weights: np.ndarray, count: int
+) -> np.ndarray:
+    valid = ~np.isnan(values)
+    w = np.where(valid, weights, 0.0)
+    sums = np.bincount(index, weights=np.where(valid, values, 0.0) * w, minlength=count)
+    totals = np.bincount(index, weights=w, minlength=count)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return sums / totals
+
+
+def _streams_to_arrays(streams: Mapping[str, Any]) -> dict[str, np.ndarray]:
+    arrays: dict[str, np.ndarray] = {}
+    for name in STREAM_TYPES:
+        stream = streams.get(name)
+        data = getattr(stream, "data", stream)
+        if not data:
+            continue
+        arrays[name] = np.asarray(
+            [np.nan if v is None else v for v in data], dtype=float
+        )
+    return arrays
+
+
+def _nan_to_none(value: float) -> float | None:
+    return None if np.isnan(value) else float(value)
@@ -4,17 +4,62 @@ REST API surface for exposing Strava activities.
 
 from __future__ import annotations
 
+from collections.abc import Callable, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
 from datetime import datetime, timedelta
-from typing import TYPE_CHECKING, Any, Protocol, SupportsFloat, runtime_checkable
+from functools import partial
+from typing import (
+    TYPE_CHECKING,
+    Annotated,
+    Any,
+    Literal,
+    Protocol,
+    SupportsFloat,
+    runtime_checkable,
+)
 
 from fastapi import FastAPI, HTTPException, Query
-from pydantic import BaseModel
-
-from .activities import fetch_recent_activities
+from pydantic import BaseModel, Field, model_validator
+from requests import RequestException
+from stravalib.exc import ObjectNotFound, RateLimitExceeded
+
+from .activities import fetch_recent_activities, iter_activity_pages
+from .admission import AdmissionConfig, AdmissionControlMiddleware
+from .analytics import (
+    DEFAULT_HR_ZONES,
+    DEFAULT_POWER_ZONES,
+    ActivityAnalytics,
+    ZoneConfig,
+    analyse_streams,
+    cached_analytics,
+    get_activity_analytics,
+    load_streams,
+)
+from .auth import get_authenticated_client
+from .history import ActivityHistory
+from .similarity import Metric, WorkoutSimilarityIndex
+from .spatial import ActivityLocationIndex
 
 if TYPE_CHECKING:
+    from stravalib.client import Client
     from stravalib.model import SummaryActivity
 
+BATCH_MAX_QUERIES = 20
+# Distinct activities whose streams one request may download, batch or not.
+ANALYTICS_MAX_IDS = 50
+BATCH_MAX_WORKERS = 4
+
+
+@dataclass
+class ActivityIndexes:
+    """
+    Local indexes answering near/similar queries, owned by a single app.
+    """
+
+    location: ActivityLocationIndex = field(default_factory=ActivityLocationIndex)
+    similarity: WorkoutSimilarityIndex = field(default_factory=WorkoutSimilarityIndex)
+
 
 class ActivityPayload(BaseModel):
     """
@@ -29,18 +74,176 @@ class ActivityPayload(BaseModel):
     elapsed_time_s: int | None = None
     start_date: datetime | None = None
     external_id: str | None = None
+    start_latlng: tuple[float, float] | None = None
+    end_latlng: tuple[float, float] | None = None
+    summary_polyline: str | None = None
+    total_elevation_gain_m: float | None = None
+    average_speed_mps: float | None = None
+    max_speed_mps: float | None = None
+    average_heartrate: float | None = None
+    max_heartrate: float | None = None
 
 
 class ActivitiesResponse(BaseModel):
     activities: list[ActivityPayload]
 
 
-def create_app() -> FastAPI:
+class SyncResponse(BaseModel):
+    fetched: int
+    added: int
+    total: int
+
+
+class NearbyActivityPayload(ActivityPayload):
+    distance_from_point_m: float
+
+
+class NearbyActivitiesResponse(BaseModel):
+    indexed_activities: int
+    activities: list[NearbyActivityPayload]
+
+
+class SimilarActivityPayload(ActivityPayload):
+    score: float
+
+
+class SimilarActivitiesResponse(BaseModel):
+    activity_id: int
+    metric: str
+    activities: list[SimilarActivityPayload]
+
+
+class SplitPayload(BaseModel):
+    index: int
+    distance_m: float
+    elapsed_time_s: float
+    average_heartrate: float | None = None
+    average_watts: float | None = None
+
+
+class ActivityAnalyticsPayload(BaseModel):
+    """
+    Time-in-zone distributions and distance splits for one activity.
+    """
+
+    activity_id: int
+    hr_zone_seconds: list[float] | None = None
+    power_zone_seconds: list[float] | None = None
+    splits: list[SplitPayload]
+
+
+class AnalyticsResponse(BaseModel):
+    hr_zones: list[float]
+    power_zones: list[float]
+    split_unit: str
+    analytics: list[ActivityAnalyticsPayload]
+
+
+class ActivitiesQuery(BaseModel):
+    type: Literal["activities"]
+    limit: int = Field(default=5, ge=1, le=50)
+
+
+class AnalyticsQuery(BaseModel):
+    type: Literal["analytics"]
+    ids: list[int] = Field(min_length=1, max_length=ANALYTICS_MAX_IDS)
+    hr_zones: list[float] | None = None
+    power_zones: list[float] | None = None
+    split_unit: Literal["km", "mi"] = "km"
+
+
+class NearQuery(BaseModel):
+    type: Literal["near"]
+    lat: float = Field(ge=-90, le=90)
+    lng: float = Field(ge=-180, le=180)
+    radius: float = Field(default=1000.0, gt=0, le=50_000)
+    limit: int = Field(default=20, ge=1, le=200)
+
+
+class SimilarQuery(BaseModel):
+    type: Literal["similar"]
+    activity_id: int
+    k: int = Field(default=5, ge=1, le=50)
+    metric: Metric = "cosine"
+
+
+BatchQuery = Annotated[
+    ActivitiesQuery | AnalyticsQuery | NearQuery | SimilarQuery,
+    Field(discriminator="type"),
+]
+
+
+class BatchRequest(BaseModel):
+    """
+    Several sub-queries answered in a single round-trip.
+    """
+
+    queries: list[BatchQuery] = Field(min_length=1, max_length=BATCH_MAX_QUERIES)
+
+    @model_validator(mode="after")
+    def _cap_stream_downloads(self) -> BatchRequest:
+        ids = {
+            aid
+            for query in self.queries
+            if isinstance(query, AnalyticsQuery)
+            for aid in query.ids
+        }
+        if len(ids) > ANALYTICS_MAX_IDS:
+            raise ValueError(
+                f"A batch may analyse at most {ANALYTICS_MAX_IDS} distinct "
+                f"activities; got {len(ids)}."
+            )
+        return self
+
+
+class BatchResult(BaseModel):
+    type: str
+    status_code: int
+    body: dict[str, Any] | None = None
+    detail: str | None = None
+
+
+class BatchResponse(BaseModel):
+    results: list[BatchResult]
+
+
+HeartRateZonesQuery = Annotated[
+    list[float] | None,
+    Query(description="Heart-rate zone upper bounds in bpm, ascending."),
+]
+PowerZonesQuery = Annotated[
+    list[float] | None,
+    Query(description="Power zone upper bounds in watts, ascending."),
+]
+
+
+def create_app(
+    admission_config: AdmissionConfig | None = None,
+    history: ActivityHistory | None = None,
+    indexes: ActivityIndexes | None = None,
+) -> FastAPI:
     """
     Build the FastAPI application with all routes and dependencies wired in.
+
+    Args:
+        admission_config: Rate and concurrency limits; read from the
+            environment when omitted.
+        history: Persisted activity history feeding the local indexes; read
+            from ``STRAVA_HISTORY_FILE`` when omitted.
+        indexes: Location and similarity indexes; empty ones when omitted.
     """
 
+    if history is None:
+        history = ActivityHistory.from_env()
+    if indexes is None:
+        indexes = ActivityIndexes()
+    _index_records(history.load(), indexes)
+
     app = FastAPI(title="Strava CustomGPT Action", version="0.1.0")
+    app.add_middleware(
+        AdmissionControlMiddleware,
+        config=admission_config or AdmissionConfig.from_env(),
+    )
 
     @app.get("/health", tags=["system"])
     def health() -> dict[str, str]:
@@ -59,19 +262,384 @@ def create_app() -> FastAPI:
             description="Maximum number of recent activities to fetch from Strava.",
         ),
     ) -> ActivitiesResponse:
-        try:
-            activities = fetch_recent_activities(limit=limit)
-        except RuntimeError as exc:
-            raise HTTPException(status_code=500, detail=str(exc)) from exc
+        return _activities_response(
+            _fetch_activities(limit, history=history, indexes=indexes)
+        )
+
+    @app.post(
+        "/activities/sync",
+        response_model=SyncResponse,
+        tags=["activities"],
+    )
+    def sync_activities() -> SyncResponse:
+        """
+        Backfill the local history (and the near/similar indexes) with every
+        activity newer than the latest one already stored; safe to retry after
+        a failure, as completed pages are kept.
+        """
+        return _sync_history(history, indexes)
+
+    @app.get(
+        "/activities/near",
+        response_model=NearbyActivitiesResponse,
+        tags=["activities"],
+    )
+    def activities_near(
+        lat: float = Query(ge=-90, le=90, description="Latitude in degrees."),
+        lng: float = Query(ge=-180, le=180, description="Longitude in degrees."),
+        radius: float = Query(
+            default=1000.0,
+            gt=0,
+            le=50_000,
+            description="Search radius in metres around the point.",
+        ),
+        limit: int = Query(
+            default=20, ge=1, le=200, description="Maximum activities to return."
+        ),
+    ) -> NearbyActivitiesResponse:
+        return _nearby_response(indexes, lat, lng, radius, limit)
+
+    @app.get(
+        "/activities/analytics",
+        response_model=AnalyticsResponse,
+        tags=["activities"],
+    )
+    def activities_analytics(
+        ids: Annotated[
+            list[int],
+            Query(
+                min_length=1,
+                max_length=ANALYTICS_MAX_IDS,
+                description="Strava activity ids to analyse (repeat the parameter).",
+            ),
+        ],
+        hr_zones: HeartRateZonesQuery = None,
+        power_zones: PowerZonesQuery = None,
+        split_unit: Literal["km", "mi"] = Query(
+            default="km", description="Length of each split."
+        ),
+    ) -> AnalyticsResponse:
+        config = _zone_config(hr_zones, power_zones, split_unit)
+        return _analytics_response(config, _fetch_analytics(ids, config))
 
-        payload = [
-            ActivityPayload(**_serialize_activity(activity)) for activity in activities
-        ]
-        return ActivitiesResponse(activities=payload)
+    @app.get(
+        "/activities/{activity_id}/similar",
+        response_model=SimilarActivitiesResponse,
+        tags=["activities"],
+    )
+    def similar_activities(
+        activity_id: int,
+        k: int = Query(
+            default=5, ge=1, le=50, description="Number of similar activities."
+        ),
+        metric: Annotated[
+            Metric,
+            Query(description="Cosine similarity (higher is closer) or L2 distance."),
+        ] = "cosine",
+    ) -> SimilarActivitiesResponse:
+        return _similar_response(indexes, activity_id, k, metric)
+
+    @app.get(
+        "/activities/{activity_id}/analytics",
+        response_model=AnalyticsResponse,
+        tags=["activities"],
+    )
+    def activity_analytics(
+        activity_id: int,
+        hr_zones: HeartRateZonesQuery = None,
+        power_zones: PowerZonesQuery = None,
+        split_unit: Literal["km", "mi"] = Query(
+            default="km", description="Length of each split."
+        ),
+    ) -> AnalyticsResponse:
+        config = _zone_config(hr_zones, power_zones, split_unit)
+        return _analytics_response(config, _fetch_analytics([activity_id], config))
+
+    @app.post("/batch", response_model=BatchResponse, tags=["system"])
+    def batch(request: BatchRequest) -> BatchResponse:
+        """
+        Answer several sub-queries at once: auth is resolved a single time,
+        overlapping Strava fetches are merged and run concurrently, and local
+        index lookups run afterwards so they see freshly listed activities.
+        """
+        return _run_batch(request.queries, history, indexes)
 
     return app
 
 
+def _fetch_activities(
+    limit: int,
+    client: Client | None = None,
+    history: ActivityHistory | None = None,
+    indexes: ActivityIndexes | None = None,
+) -> list[dict[str, Any]]:
+    try:
+        activities = fetch_recent_activities(limit=limit, client=client)
+    except (RuntimeError, RequestException) as exc:
+        raise _http_error(exc) from exc
+
+    records = [_activity_record(activity) for activity in activities]
+    if history is not None:
+        history.merge(records)
+    if indexes is not None:
+        _index_records(records, indexes)
+    return records
+
+
+def _sync_history(
+    history: ActivityHistory, indexes: ActivityIndexes, client: Client | None = None
+) -> SyncResponse:
+    fetched = added = 0
+    try:
+        # Each page is persisted as it arrives, so a sync interrupted by a
+        # rate limit resumes from the latest stored activity.
+        pages = iter_activity_pages(history.latest_start_date(), client=client)
+        for activities in pages:
+            records = [_activity_record(activity) for activity in activities]
+            added += history.merge(records)
+            _index_records(records, indexes)
+            fetched += len(records)
+    except (RuntimeError, RequestException) as exc:
+        raise _http_error(exc) from exc
+    return SyncResponse(fetched=fetched, added=added, total=len(history))
+
+
+def _activity_record(activity: SummaryActivity) -> dict[str, Any]:
+    # JSON-ready so the same record is indexed, persisted and reloaded.
+    return ActivityPayload(**_serialize_activity(activity)).model_dump(mode="json")
+
+
+def _index_records(records: list[dict[str, Any]], indexes: ActivityIndexes) -> None:
+    indexes.location.add(records)
+    indexes.similarity.add(records)
+
+
+def _activities_response(serialized: list[dict[str, Any]]) -> ActivitiesResponse:
+    return ActivitiesResponse(
+        activities=[ActivityPayload(**record) for record in serialized]
+    )
+
+
+def _nearby_response(
+    indexes: ActivityIndexes, lat: float, lng: float, radius: float, limit: int
+) -> NearbyActivitiesResponse:
+    matches = indexes.location.query(lat, lng, radius)[:limit]
+    return NearbyActivitiesResponse(
+        indexed_activities=len(indexes.location),
+        activities=[
+            NearbyActivityPayload(**record, distance_from_point_m=distance)
+            for record, distance in matches
+        ],
+    )
+
+
+def _similar_response(
+    indexes: ActivityIndexes, activity_id: int, k: int, metric: Metric
+) -> SimilarActivitiesResponse:
+    if activity_id not in indexes.similarity:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Activity {activity_id} has not been indexed; run POST /activities/sync first.",
+        )
+    (matches,) = indexes.similarity.query([activity_id], k=k, metric=metric)
+    return SimilarActivitiesResponse(
+        activity_id=activity_id,
+        metric=metric,
+        activities=[
+            SimilarActivityPayload(**record, score=score) for record, score in matches
+        ],
+    )
+
+
+def _zone_config(
+    hr_zones: list[float] | None, power_zones: list[float] | None, split_unit: str
+) -> ZoneConfig:
+    try:
+        return ZoneConfig(
+            heart_rate=tuple(hr_zones) if hr_zones else DEFAULT_HR_ZONES,
+            power=tuple(power_zones) if power_zones else DEFAULT_POWER_ZONES,
+            split_unit=split_unit,
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=422, detail=str(exc)) from exc
+
+
+def _fetch_analytics(
+    activity_ids: list[int], config: ZoneConfig, client: Client | None = None
+) -> list[ActivityAnalytics]:
+    try:
+        return get_activity_analytics(activity_ids, config, client=client)
+    except (RuntimeError, RequestException) as exc:
+        raise _http_error(exc) from exc
+
+
+def _analytics_response(
+    config: ZoneConfig, results: list[ActivityAnalytics]
+) -> AnalyticsResponse:
+    return AnalyticsResponse(
+        hr_zones=list(config.heart_rate),
+        power_zones=list(config.power),
+        split_unit=config.split_unit,
+        analytics=[ActivityAnalyticsPayload(**asdict(item)) for item in results],
+    )
+
+
+def _run_batch(
+    queries: Sequence[BatchQuery],
+    history: ActivityHistory | None = None,
+    indexes: ActivityIndexes | None = None,
+) -> BatchResponse:
+    # Zone configs are validated up front so invalid sub-queries never hit Strava.
+    configs: dict[int, ZoneConfig | HTTPException] = {}
+    analytics_ids: dict[ZoneConfig, list[int]] = {}
+    for index, query in enumerate(queries):
+        if not isinstance(query, AnalyticsQuery):
+            continue
+        try:
+            config = _zone_config(query.hr_zones, query.power_zones, query.split_unit)
+        except HTTPException as exc:
+            configs[index] = exc
+            continue
+        configs[index] = config
+        ids = analytics_ids.setdefault(config, [])
+        ids.extend(aid for aid in query.ids if aid not in ids)
+
+    # Streams are downloaded once per activity, whatever the zone configs, and
+    # every config missing from the memo is then computed from the shared arrays.
+    analysed = {
+        config: cached_analytics(ids, config) for config, ids in analytics_ids.items()
+    }
+    stream_ids = list(
+        dict.fromkeys(
+            aid
+            for config, ids in analytics_ids.items()
+            for aid in ids
+            if aid not in analysed[config]
+        )
+    )
+    activity_limit = max(
+        (q.limit for q in queries if isinstance(q, ActivitiesQuery)), default=0
+    )
+    indexes = indexes or ActivityIndexes()
+    fetched = _run_strava_fetches(activity_limit, stream_ids, history, indexes)
+
+    for config, ids in analytics_ids.items():
+        loaded = {
+            aid: fetched[("streams", aid)]
+            for aid in ids
+            if aid not in analysed[config]
+            and not isinstance(fetched[("streams", aid)], HTTPException)
+        }
+        for item in analyse_streams(loaded, config):
+            analysed[config][item.activity_id] = item
+
+    results = []
+    for index, query in enumerate(queries):
+        try:
+            body = _batch_answer(query, configs.get(index), fetched, analysed, indexes)
+        except HTTPException as exc:
+            results.append(
+                BatchResult(
+                    type=query.type, status_code=exc.status_code, detail=str(exc.detail)
+                )
+            )
+        else:
+            results.append(
+                BatchResult(
+                    type=query.type, status_code=200, body=body.model_dump(mode="json")
+                )
+            )
+    return BatchResponse(results=results)
+
+
+def _run_strava_fetches(
+    activity_limit: int,
+    stream_ids: list[int],
+    history: ActivityHistory | None = None,
+    indexes: ActivityIndexes | None = None,
+) -> dict[Any, Any]:
+    """
+    Resolve auth once and run each distinct Strava-bound fetch concurrently.
+
+    Returns a mapping from fetch key (``"activities"`` or ``("streams", id)``)
+    to its result, or to an ``HTTPException`` describing why it failed.
+    """
+    tasks: dict[Any, Callable[[Client], Any]] = {}
+    if activity_limit:
+        tasks["activities"] = partial(
+            _fetch_activities, activity_limit, history=history, indexes=indexes
+        )
+    for activity_id in stream_ids:
+        tasks[("streams", activity_id)] = partial(_load_streams, activity_id)
+    if not tasks:
+        return {}
+
+    try:
+        client = get_authenticated_client()
+    except RuntimeError as exc:
+        return dict.fromkeys(tasks, HTTPException(status_code=500, detail=str(exc)))
+
+    outcomes: dict[Any, Any] = {}
+    with ThreadPoolExecutor(max_workers=min(BATCH_MAX_WORKERS, len(tasks))) as pool:
+        futures = {key: pool.submit(task, client) for key, task in tasks.items()}
+        for key, future in futures.items():
+            try:
+                outcomes[key] = future.result()
+            except Exception as exc:  # one failure must not sink the batch
+                outcomes[key] = _http_error(exc)
+    return outcomes
+
+
+def _load_streams(activity_id: int, client: Client) -> Any:
+    return load_streams(activity_id, client=client)
+
+
+def _batch_answer(
+    query: BatchQuery,
+    config: ZoneConfig | HTTPException | None,
+    fetched: dict[Any, Any],
+    analysed: dict[ZoneConfig, dict[int, ActivityAnalytics]],
+    indexes: ActivityIndexes,
+) -> BaseModel:
+    if isinstance(query, NearQuery):
+        return _nearby_response(
+            indexes, query.lat, query.lng, query.radius, query.limit
+        )
+    if isinstance(query, SimilarQuery):
+        return _similar_response(indexes, query.activity_id, query.k, query.metric)
+    if isinstance(query, ActivitiesQuery):
+        outcome = fetched["activities"]
+        if isinstance(outcome, HTTPException):
+            raise outcome
+        return _activities_response(outcome[: query.limit])
+
+    if isinstance(config, HTTPException):
+        raise config
+    assert isinstance(config, ZoneConfig)
+    items = []
+    for activity_id in query.ids:
+        item = analysed[config].get(activity_id)
+        if item is None:
+            raise fetched[("streams", activity_id)]
+        items.append(item)
+    return _analytics_response(config, items)
+
+
+def _http_error(exc: Exception) -> HTTPException:
+    """
+    Map failures of Strava-bound work to the status reported to the caller.
+    """
+    if isinstance(exc, HTTPException):
+        return exc
+    if isinstance(exc, ObjectNotFound):
+        return HTTPException(status_code=404, detail="Not found on Strava.")
+    if isinstance(exc, RateLimitExceeded):
+        return HTTPException(status_code=503, detail="Strava rate limit exceeded.")
+    if isinstance(exc, RequestException):
+        return HTTPException(status_code=502, detail=f"Strava request failed: {exc}")
+    return HTTPException(status_code=500, detail=str(exc))
+
+
 def _serialize_activity(activity: SummaryActivity) -> dict[str, Any]:
     """
     Convert a stravalib activity object into serializable primitives.
@@ -86,24 +654,56 @@ def _serialize_activity(activity: SummaryActivity) -> dict[str, Any]:
         "elapsed_time_s": _duration_to_seconds(getattr(activity, "elapsed_time", None)),
         "start_date": getattr(activity, "start_date", None),
         "external_id": getattr(activity, "external_id", None),
+        "start_latlng": _latlng_to_pair(getattr(activity, "start_latlng", None)),
+        "end_latlng": _latlng_to_pair(getattr(activity, "end_latlng", None)),
+        "summary_polyline": getattr(
+            getattr(activity, "map", None), "summary_polyline", None
+        ),
+        "total_elevation_gain_m": _distance_to_meters(
+            getattr(activity, "total_elevation_gain", None)
+        ),
+        "average_speed_mps": _quantity_to_float(
+            getattr(activity, "average_speed", None)
+        ),
+        "max_speed_mps": _quantity_to_float(getattr(activity, "max_speed", None)),
+        "average_heartrate": getattr(activity, "average_heartrate", None),
+        "max_heartrate": getattr(activity, "max_heartrate", None),
     }
 
 
+def _latlng_to_pair(latlng: Any) -> tuple[float, float] | None:
+    if latlng is None:
+        return None
+    values = getattr(latlng, "root", latlng)
+    try:
+        lat, lng = values
+        return float(lat), float(lng)
+    except (TypeError, ValueError):
+        return None
+
+
 @runtime_checkable
 class _HasNumericValue(Protocol):
     num: float | int
 
 
-DistanceLike = SupportsFloat | _HasNumericValue | float | int
+QuantityLike = SupportsFloat | _HasNumericValue | float | int
+
 
+def _distance_to_meters(distance_obj: QuantityLike | None) -> float | None:
+    return _quantity_to_float(distance_obj)
 
-def _distance_to_meters(distance_obj: DistanceLike | None) -> float | None:
-    if distance_obj is None:
+
+def _quantity_to_float(quantity: QuantityLike | None) -> float | None:
+    """
+    Coerce a stravalib quantity (already in SI units) or plain number to float.
+    """
+    if quantity is None:
         return None
-    if isinstance(distance_obj, _HasNumericValue):
-        return float(distance_obj.num)
+    if isinstance(quantity, _HasNumericValue):
+        return float(quantity.num)
     try:
-        return float(distance_obj)
+        return float(quantity)
     except (TypeError, ValueError):
         return None
 
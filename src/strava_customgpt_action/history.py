@@ -0,0 +1,90 @@
+"""
+Local, persisted copy of the athlete's activity history feeding the indexes.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import threading
+from collections.abc import Iterable, Mapping
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+
+DEFAULT_HISTORY_FILE = "~/.strava-customgpt-history.json"
+
+
+class ActivityHistory:
+    """
+    Serialized activities keyed by id, persisted as JSON so the location and
+    similarity indexes survive restarts.
+    """
+
+    def __init__(self, path: Path | None) -> None:
+        self.path = path
+        self._records: dict[int, dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> ActivityHistory:
+        raw = os.environ.get("STRAVA_HISTORY_FILE", DEFAULT_HISTORY_FILE)
+        return cls(Path(raw).expanduser() if raw else None)
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def records(self) -> list[dict[str, Any]]:
+        with self._lock:
+            return list(self._records.values())
+
+    def load(self) -> list[dict[str, Any]]:
+        """
+        Read the persisted history, ignoring a missing or unreadable file.
+        """
+        if self.path is None or not self.path.exists():
+            return []
+        try:
+            stored = json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            return []
+        with self._lock:
+            for record in stored.get("activities", []):
+                self._records[int(record["id"])] = record
+        return self.records()
+
+    def merge(self, records: Iterable[Mapping[str, Any]]) -> int:
+        """
+        Insert or refresh JSON-serializable records and persist the result.
+
+        Returns:
+            The number of activities that were not known before.
+        """
+        items = [dict(r) for r in records]
+        if not items:
+            return 0
+        with self._lock:
+            added = sum(1 for r in items if int(r["id"]) not in self._records)
+            changed = [r for r in items if self._records.get(int(r["id"])) != r]
+            for record in changed:
+                self._records[int(record["id"])] = record
+            if changed:
+                self._persist()
+        return added
+
+    def latest_start_date(self) -> datetime | None:
+        with self._lock:
+            dates = [
+                datetime.fromisoformat(r["start_date"])
+                for r in self._records.values()
+                if r.get("start_date")
+            ]
+        return max(dates, default=None)
+
+    def _persist(self) -> None:
+        if self.path is None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        tmp.write_text(json.dumps({"activities": list(self._records.values())}))
+        tmp.replace(self.path)
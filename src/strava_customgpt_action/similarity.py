@@ -0,0 +1,201 @@
+"""
+Feature-vector index for "find workouts like this one" queries.
+"""
+
+from __future__ import annotations
+
+import math
+import threading
+from collections.abc import Iterable, Mapping, Sequence
+from typing import Any, Literal
+
+import numpy as np
+
+SPORT_FAMILIES = {
+    "Run": ("Run", "TrailRun", "VirtualRun"),
+    "Ride": (
+        "Ride",
+        "VirtualRide",
+        "GravelRide",
+        "MountainBikeRide",
+        "EBikeRide",
+        "EMountainBikeRide",
+    ),
+    "Swim": ("Swim",),
+    "Walk": ("Walk", "Hike"),
+}
+_FAMILY_COLUMN = {
+    sport: column
+    for column, members in enumerate(SPORT_FAMILIES.values())
+    for sport in members
+}
+_OTHER_COLUMN = len(SPORT_FAMILIES)
+NUMERIC_FEATURES = (
+    "log_distance",
+    "log_moving_time",
+    "pace_s_per_km",
+    "max_speed_mps",
+    "average_heartrate",
+    "max_heartrate",
+    "elevation_gain_per_km",
+)
+FEATURE_COUNT = len(SPORT_FAMILIES) + 1 + len(NUMERIC_FEATURES)
+INITIAL_CAPACITY = 256
+
+Metric = Literal["cosine", "l2"]
+
+
+def activity_features(activity: Mapping[str, Any]) -> np.ndarray:
+    """
+    Build the raw feature vector for a serialized activity.
+
+    Missing measurements are left as NaN and imputed at query time.
+    """
+    vector = np.full(FEATURE_COUNT, np.nan)
+    sport = str(activity.get("sport_type") or "")
+    vector[: _OTHER_COLUMN + 1] = 0.0
+    vector[_FAMILY_COLUMN.get(sport, _OTHER_COLUMN)] = 1.0
+
+    distance = activity.get("distance_m")
+    moving = activity.get("moving_time_s")
+    elevation = activity.get("total_elevation_gain_m")
+    numeric = vector[_OTHER_COLUMN + 1 :]
+    if distance:
+        numeric[0] = math.log1p(distance)
+    if moving:
+        numeric[1] = math.log1p(moving)
+    if distance and moving:
+        numeric[2] = moving / (distance / 1000.0)
+    numeric[3] = _as_float(activity.get("max_speed_mps"))
+    numeric[4] = _as_float(activity.get("average_heartrate"))
+    numeric[5] = _as_float(activity.get("max_heartrate"))
+    if distance and elevation is not None:
+        numeric[6] = elevation / (distance / 1000.0)
+    return vector
+
+
+class WorkoutSimilarityIndex:
+    """
+    Contiguous matrix of activity feature vectors supporting batched
+    nearest-neighbour search.
+    """
+
+    def __init__(self, capacity: int = INITIAL_CAPACITY) -> None:
+        self._matrix = np.empty((capacity, FEATURE_COUNT))
+        self._ids: list[int] = []
+        self._rows: dict[int, int] = {}
+        self._payloads: dict[int, dict[str, Any]] = {}
+        self._normalized: np.ndarray | None = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, activity_id: object) -> bool:
+        return activity_id in self._rows
+
+    def add(self, activities: Iterable[Mapping[str, Any]]) -> None:
+        """
+        Insert or refresh serialized activities; existing rows are overwritten.
+        """
+        items = [dict(a) for a in activities]
+        if not items:
+            return
+        vectors = np.vstack([activity_features(a) for a in items])
+
+        with self._lock:
+            for activity, vector in zip(items, vectors, strict=True):
+                activity_id = int(activity["id"])
+                row = self._rows.get(activity_id)
+                if row is None:
+                    row = len(self._ids)
+                    self._grow(row + 1)
+                    self._rows[activity_id] = row
+                    self._ids.append(activity_id)
+                self._matrix[row] = vector
+                self._payloads[activity_id] = activity
+            self._normalized = None
+
+    def query(
+        self, activity_ids: Sequence[int], k: int = 5, metric: Metric = "cosine"
+    ) -> list[list[tuple[dict[str, Any], float]]]:
+        """
+        Return the ``k`` most similar activities for each query id.
+
+        Scores are cosine similarities (higher is closer) or L2 distances
+        (lower is closer) over standardized features; the query activity
+        itself is excluded.
+
+        Raises:
+            KeyError: If a query id has not been indexed.
+        """
+        with self._lock:
+            rows = np.array([self._rows[aid] for aid in activity_ids], dtype=np.int64)
+            features = self._standardized()
+            ids = np.array(self._ids, dtype=np.int64)
+            payloads = self._payloads
+
+        queries = features[rows]
+        if metric == "cosine":
+            norms = np.linalg.norm(features, axis=1)
+            norms[norms == 0] = 1.0
+            unit = features / norms[:, None]
+            scores = unit[rows] @ unit.T
+            order_sign = -1.0
+        else:
+            sq = np.einsum("ij,ij->i", features, features)
+            dist_sq = sq[rows][:, None] + sq[None, :] - 2.0 * queries @ features.T
+            scores = np.sqrt(np.maximum(dist_sq, 0.0))
+            order_sign = 1.0
+
+        ranked = order_sign * scores
+        ranked[np.arange(len(rows)), rows] = np.inf
+        top = min(k, len(ids) - 1)
+        if top <= 0:
+            return [[] for _ in activity_ids]
+        candidates = np.argpartition(ranked, top - 1, axis=1)[:, :top]
+        results = []
+        for q, cols in enumerate(candidates):
+            cols = cols[np.argsort(ranked[q, cols])]
+            results.append([(payloads[int(ids[c])], float(scores[q, c])) for c in cols])
+        return results
+
+    def clear(self) -> None:
+        with self._lock:
+            self._ids.clear()
+            self._rows.clear()
+            self._payloads.clear()
+            self._normalized = None
+
+    def _grow(self, size: int) -> None:
+        capacity = max(self._matrix.shape[0], 1)
+        if size <= capacity:
+            return
+        while capacity < size:
+            capacity *= 2
+        grown = np.empty((capacity, FEATURE_COUNT))
+        grown[: len(self._ids)] = self._matrix[: len(self._ids)]
+        self._matrix = grown
+
+    def _standardized(self) -> np.ndarray:
+        # Cached until the next insert so repeated queries are a single matmul.
+        if self._normalized is None:
+            raw = self._matrix[: len(self._ids)]
+            present = ~np.isnan(raw)
+            filled = np.where(present, raw, 0.0)
+            counts = np.maximum(present.sum(axis=0), 1)
+            mean = filled.sum(axis=0) / counts
+            centered = np.where(present, raw - mean, 0.0)
+            std = np.sqrt((centered**2).sum(axis=0) / counts)
+            std[std == 0] = 1.0
+            self._normalized = centered / std
+        return self._normalized
+
+
+def _as_float(value: Any) -> float:
+    if value is None:
+        return np.nan
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
@@ -0,0 +1,263 @@
+"""
+Polyline decoding and a local grid index for location-based activity queries.
+"""
+
+from __future__ import annotations
+
+import threading
+from collections import defaultdict
+from collections.abc import Iterable, Mapping, Sequence
+from typing import Any
+
+import numpy as np
+
+EARTH_RADIUS_M = 6_371_008.8
+# Grid cell edge in degrees (~5.5 km of latitude); tracks are bucketed by the
+# cells their points fall in, so a query only inspects nearby activities.
+CELL_DEG = 0.05
+POLYLINE_PRECISION = 1e5
+
+
+def decode_polylines(polylines: Sequence[str]) -> list[np.ndarray]:
+    """
+    Decode many Google encoded polylines in one vectorized pass.
+
+    Malformed polylines (truncated, odd value count, out-of-range characters
+    or coordinates) decode to an empty track without affecting the others.
+
+    Args:
+        polylines: Encoded polylines as returned in Strava's ``summary_polyline``.
+
+    Returns:
+        One ``(n, 2)`` array of ``[lat, lng]`` degrees per input polyline.
+    """
+    tracks = [np.empty((0, 2)) for _ in polylines]
+    # A polyline must end on a chunk without the continuation bit, otherwise
+    # its trailing chunks would merge into the next polyline's first value.
+    candidates = [
+        index
+        for index, p in enumerate(polylines)
+        if p and p.isascii() and (ord(p[-1]) - 63) & 0x20 == 0
+    ]
+    while candidates:
+        decoded, valid = _decode_concatenated([polylines[i] for i in candidates])
+        if valid.all():
+            for index, track in zip(candidates, decoded, strict=True):
+                tracks[index] = track
+            break
+        candidates = [i for i, ok in zip(candidates, valid, strict=True) if ok]
+    return tracks
+
+
+def _decode_concatenated(polylines: list[str]) -> tuple[list[np.ndarray], np.ndarray]:
+    lengths = np.array([len(p) for p in polylines], dtype=np.int64)
+    raw = np.frombuffer("".join(polylines).encode("ascii"), dtype=np.uint8)
+    chunks = raw.astype(np.int64) - 63
+    # A value ends at every chunk without the continuation bit.
+    is_end = (chunks & 0x20) == 0
+    ends = np.flatnonzero(is_end)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    position = np.arange(chunks.size) - np.repeat(starts, ends - starts + 1)
+    encoded = np.add.reduceat((chunks & 0x1F) << (5 * np.minimum(position, 11)), starts)
+    deltas = np.where(encoded & 1, ~(encoded >> 1), encoded >> 1)
+
+    # Count the values belonging to each polyline to split the flat result.
+    char_bounds = np.concatenate(([0], np.cumsum(lengths)))
+    ends_before = np.concatenate(([0], np.cumsum(is_end)))
+    value_bounds = ends_before[char_bounds]
+    bad_chars = np.add.reduceat((chunks < 0) | (chunks > 63), char_bounds[:-1])
+    valid = (bad_chars == 0) & (np.diff(value_bounds) % 2 == 0)
+
+    tracks = []
+    for row, (lo, hi) in enumerate(
+        zip(value_bounds[:-1], value_bounds[1:], strict=True)
+    ):
+        if not valid[row]:
+            tracks.append(np.empty((0, 2)))
+            continue
+        track = np.cumsum(deltas[lo:hi].reshape(-1, 2), axis=0) / POLYLINE_PRECISION
+        if (np.abs(track[:, 0]) > 90).any() or (np.abs(track[:, 1]) > 180).any():
+            valid[row] = False
+        tracks.append(track)
+    return tracks, valid
+
+
+def track_distance_m(lat: float, lng: float, track: np.ndarray) -> float:
+    """
+    Shortest distance in metres from a point to a track, measured against its
+    segments (summary polylines are sparse) in a local equirectangular frame.
+    """
+    scale = np.radians(1.0) * EARTH_RADIUS_M
+    xy = np.column_stack(
+        (
+            _wrap_lng(track[:, 1] - lng) * np.cos(np.radians(lat)) * scale,
+            (track[:, 0] - lat) * scale,
+        )
+    )
+    if len(xy) == 1:
+        return float(np.hypot(*xy[0]))
+
+    a, b = xy[:-1], xy[1:]
+    ab = b - a
+    length_sq = np.einsum("ij,ij->i", ab, ab)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        t = np.clip(-np.einsum("ij,ij->i", a, ab) / length_sq, 0.0, 1.0)
+    t = np.nan_to_num(t)
+    closest = a + ab * t[:, None]
+    return float(np.hypot(closest[:, 0], closest[:, 1]).min())
+
+
+class ActivityLocationIndex:
+    """
+    In-memory grid index mapping geographic cells to the activities crossing them.
+    """
+
+    def __init__(self, cell_deg: float = CELL_DEG) -> None:
+        self.cell_deg = cell_deg
+        self._cells: defaultdict[tuple[int, int], set[int]] = defaultdict(set)
+        self._tracks: dict[int, np.ndarray] = {}
+        self._payloads: dict[int, dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._tracks)
+
+    def add(self, activities: Iterable[Mapping[str, Any]]) -> None:
+        """
+        Index serialized activities (as produced by the API layer).
+
+        Activities without a polyline fall back to their start/end coordinates;
+        activities without any location are ignored.
+        """
+        items = list(activities)
+        with_polyline = [a for a in items if a.get("summary_polyline")]
+        decoded = decode_polylines([a["summary_polyline"] for a in with_polyline])
+        tracks = {a["id"]: t for a, t in zip(with_polyline, decoded, strict=True)}
+
+        for activity in items:
+            track = tracks.get(activity["id"])
+            if track is None or track.size == 0:
+                endpoints = [
+                    p
+                    for p in (activity.get("start_latlng"), activity.get("end_latlng"))
+                    if p
+                ]
+                if not endpoints:
+                    continue
+                track = np.asarray(endpoints, dtype=float)
+            self._insert(int(activity["id"]), track, dict(activity))
+
+    def query(
+        self, lat: float, lng: float, radius_m: float
+    ) -> list[tuple[dict[str, Any], float]]:
+        """
+        Return ``(activity, distance_m)`` pairs for activities passing within
+        ``radius_m`` of the point, closest first.
+        """
+        lat_span = float(np.degrees(radius_m / EARTH_RADIUS_M))
+        lat_lo = self._cell_index(max(lat - lat_span, -90.0))
+        lat_hi = self._cell_index(min(lat + lat_span, 90.0))
+        rows = range(lat_lo, lat_hi + 1)
+        columns = self._lng_columns(lat, lng, lat_span)
+
+        with self._lock:
+            candidates: set[int] = set()
+            if len(rows) * len(columns) <= len(self._cells):
+                for i in rows:
+                    for j in columns:
+                        candidates |= self._cells.get((i, j), set())
+            else:
+                # Wide search boxes (large radius, near the poles): scanning the
+                # occupied cells is cheaper than enumerating empty ones.
+                for (i, j), bucket in self._cells.items():
+                    if i in rows and j in columns:
+                        candidates |= bucket
+            tracks = {aid: self._tracks[aid] for aid in candidates}
+            payloads = {aid: self._payloads[aid] for aid in candidates}
+
+        matches = []
+        for aid, track in tracks.items():
+            distance = track_distance_m(lat, lng, track)
+            if distance <= radius_m:
+                matches.append((payloads[aid], distance))
+        matches.sort(key=lambda item: item[1])
+        return matches
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cells.clear()
+            self._tracks.clear()
+            self._payloads.clear()
+
+    def _insert(self, activity_id: int, track: np.ndarray, payload: dict) -> None:
+        cells = self._track_cells(track)
+        with self._lock:
+            self._remove(activity_id)
+            for i, j in cells.tolist():
+                self._cells[(i, j)].add(activity_id)
+            self._tracks[activity_id] = track
+            self._payloads[activity_id] = payload
+
+    def _remove(self, activity_id: int) -> None:
+        track = self._tracks.pop(activity_id, None)
+        self._payloads.pop(activity_id, None)
+        if track is None:
+            return
+        for i, j in self._track_cells(track).tolist():
+            bucket = self._cells.get((i, j))
+            if bucket is not None:
+                bucket.discard(activity_id)
+                if not bucket:
+                    del self._cells[(i, j)]
+
+    def _track_cells(self, track: np.ndarray) -> np.ndarray:
+        """
+        Unique cells touched by a track, densifying long segments so that cells
+        crossed between two sparse polyline vertices are indexed too.
+        """
+        if len(track) > 1:
+            step = self.cell_deg / 2
+            seg = np.diff(track, axis=0)
+            pieces = np.maximum(np.ceil(np.abs(seg).max(axis=1) / step), 1).astype(
+                np.int64
+            )
+            # Segments crossing the antimeridian take the short way round.
+            seg[:, 1] = _wrap_lng(seg[:, 1])
+            owner = np.repeat(np.arange(len(seg)), pieces)
+            offset = np.arange(owner.size) - np.repeat(
+                np.cumsum(pieces) - pieces, pieces
+            )
+            frac = offset / pieces[owner]
+            track = np.vstack((track[owner] + seg[owner] * frac[:, None], track[-1:]))
+        points = np.column_stack((track[:, 0], _wrap_lng(track[:, 1])))
+        cells = np.floor(points / self.cell_deg).astype(np.int64)
+        cells[:, 1] %= self._lng_cell_count
+        return np.unique(cells, axis=0)
+
+    @property
+    def _lng_cell_count(self) -> int:
+        return int(round(360.0 / self.cell_deg))
+
+    def _lng_columns(self, lat: float, lng: float, lat_span: float) -> set[int]:
+        """
+        Longitude cell columns within ``lat_span``-equivalent distance of
+        ``lng``, wrapped around the antimeridian.
+        """
+        count = self._lng_cell_count
+        cos_lat = np.cos(np.radians(min(abs(lat) + lat_span, 90.0)))
+        if cos_lat <= 0 or 2 * lat_span / cos_lat >= 360.0:
+            return set(range(count))
+        lng_span = lat_span / cos_lat
+        lo = self._cell_index(lng - lng_span)
+        hi = self._cell_index(lng + lng_span)
+        return {j % count for j in range(lo, hi + 1)}
+
+    def _cell_index(self, degrees: float) -> int:
+        return int(np.floor(degrees / self.cell_deg))
+
+
+def _wrap_lng(delta: Any) -> Any:
+    """
+    Wrap longitudes (or longitude differences) into ``[-180, 180)``.
+    """
+    return (np.asarray(delta) + 180.0) % 360.0 - 180.0
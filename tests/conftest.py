@@ -26,3 +26,14 @@ def auth_module(tmp_path, monkeypatch):
     yield auth
     # Remove module so subsequent tests can reconfigure environment if needed.
     sys.modules.pop("strava_customgpt_action.auth", None)
+
+
+@pytest.fixture(autouse=True)
+def history_file(tmp_path, monkeypatch):
+    """
+    Keep the persisted activity history of every test inside its temp dir.
+    """
+
+    path = tmp_path / "history.json"
+    monkeypatch.setenv("STRAVA_HISTORY_FILE", str(path))
+    return path
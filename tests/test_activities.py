@@ -40,3 +40,31 @@ def test_fetch_recent_activities_wraps_access_error(monkeypatch):
 
     with pytest.raises(RuntimeError, match="Authentication with Strava failed"):
         activities.fetch_recent_activities(limit=1)
+
+
+def test_fetch_recent_activities_reuses_given_client(monkeypatch):
+    class FakeClient:
+        def get_activities(self, limit: int):
+            return [SimpleNamespace(id=3, name="Swim")]
+
+    def _no_auth():
+        raise AssertionError("auth should not be resolved again")
+
+    monkeypatch.setattr(activities, "get_authenticated_client", _no_auth)
+
+    result = activities.fetch_recent_activities(limit=1, client=FakeClient())
+    assert [a.name for a in result] == ["Swim"]
+
+
+def test_iter_activity_pages_lists_oldest_first_in_pages():
+    seen = {}
+
+    class FakeClient:
+        def get_activities(self, after):
+            seen["after"] = after
+            return (SimpleNamespace(id=i) for i in range(5))
+
+    pages = list(activities.iter_activity_pages(page_size=2, client=FakeClient()))
+
+    assert seen["after"] == activities.HISTORY_START
+    assert [[a.id for a in page] for page in pages] == [[0, 1], [2, 3], [4]]
@@ -0,0 +1,209 @@
+from __future__ import annotations
+
+import asyncio
+
+from fastapi.testclient import TestClient
+
+from strava_customgpt_action import admission, api
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 100.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_token_bucket_limits_each_client_separately():
+    clock = FakeClock()
+    limiter = admission.TokenBucketLimiter(rate=2.0, burst=2.0, clock=clock)
+
+    assert limiter.consume("a") == 0.0
+    assert limiter.consume("a") == 0.0
+    assert limiter.consume("a") == 0.5
+    assert limiter.consume("b") == 0.0
+
+    clock.now += 0.5
+    assert limiter.consume("a") == 0.0
+
+
+def test_gate_prefers_cheap_requests_and_bounds_queue():
+    async def scenario():
+        gate = admission.AdmissionGate(max_in_flight=1, queue_size=2)
+        assert await gate.acquire(admission.PRIORITY_STRAVA, timeout=1)
+
+        order: list[str] = []
+
+        async def wait(name: str, priority: int) -> None:
+            if await gate.acquire(priority, timeout=1):
+                order.append(name)
+                gate.release()
+            else:
+                order.append(f"{name}:rejected")
+
+        strava = asyncio.create_task(wait("strava", admission.PRIORITY_STRAVA))
+        cheap = asyncio.create_task(wait("cheap", admission.PRIORITY_CHEAP))
+        await asyncio.sleep(0)
+        # Queue is full: an equal-priority request is refused straight away,
+        # while a cheap one displaces the queued Strava-bound request.
+        assert not await gate.acquire(admission.PRIORITY_STRAVA, timeout=1)
+        displacing = asyncio.create_task(wait("cheap2", admission.PRIORITY_CHEAP))
+        await asyncio.sleep(0)
+
+        gate.release()
+        await asyncio.gather(strava, cheap, displacing)
+        return order, gate.in_flight, gate.queued
+
+    order, in_flight, queued = asyncio.run(scenario())
+    assert order == ["strava:rejected", "cheap", "cheap2"]
+    assert in_flight == 0
+    assert queued == 0
+
+
+def test_gate_times_out_queued_requests():
+    async def scenario():
+        gate = admission.AdmissionGate(max_in_flight=1, queue_size=4)
+        await gate.acquire(admission.PRIORITY_CHEAP, timeout=1)
+        admitted = await gate.acquire(admission.PRIORITY_CHEAP, timeout=0.01)
+        return admitted, gate.queued
+
+    assert asyncio.run(scenario()) == (False, 0)
+
+
+def test_admission_gate_without_queue_rejects_when_full():
+    async def scenario():
+        gate = admission.AdmissionGate(max_in_flight=1, queue_size=0)
+        first = await gate.acquire(admission.PRIORITY_STRAVA, timeout=1)
+        second = await gate.acquire(admission.PRIORITY_CHEAP, timeout=1)
+        return first, second, gate.in_flight
+
+    assert asyncio.run(scenario()) == (True, False, 1)
+
+
+def test_middleware_returns_429_with_retry_after():
+    config = admission.AdmissionConfig(
+        rate_per_second=0.5, burst=2, api_keys=frozenset({"trusted"})
+    )
+    client = TestClient(api.create_app(admission_config=config))
+
+    assert client.get("/openapi.json").status_code == 200
+    assert client.get("/openapi.json").status_code == 200
+    # A verified key gets its own bucket.
+    trusted = client.get("/openapi.json", headers={"X-API-Key": "trusted"})
+    assert trusted.status_code == 200
+
+    resp = client.get("/openapi.json")
+    assert resp.status_code == 429
+    assert resp.headers["Retry-After"] == "2"
+    assert resp.json()["detail"] == "Rate limit exceeded."
+
+
+def test_middleware_ignores_rotating_unverified_credentials():
+    config = admission.AdmissionConfig(rate_per_second=0.01, burst=2)
+    client = TestClient(api.create_app(admission_config=config))
+
+    statuses = [
+        client.get(
+            "/openapi.json",
+            headers={"X-API-Key": f"random-{i}", "Authorization": f"Bearer {i}"},
+        ).status_code
+        for i in range(4)
+    ]
+    assert statuses == [200, 200, 429, 429]
+
+
+def test_middleware_never_throttles_health():
+    config = admission.AdmissionConfig(
+        rate_per_second=0.01, burst=1, max_in_flight=1, queue_size=0
+    )
+    client = TestClient(api.create_app(admission_config=config))
+
+    assert client.get("/openapi.json").status_code == 200
+    assert client.get("/openapi.json").status_code == 429
+    assert [client.get("/health").status_code for _ in range(5)] == [200] * 5
+
+
+def test_token_bucket_bounds_tracked_clients():
+    clock = FakeClock()
+    limiter = admission.TokenBucketLimiter(
+        rate=0.001, burst=1.0, clock=clock, max_clients=10
+    )
+    for i in range(50):
+        limiter.consume(f"ip:{i}")
+
+    assert len(limiter._buckets) <= 10
+
+
+def test_token_bucket_sweeps_idle_clients_before_trimming():
+    clock = FakeClock()
+    limiter = admission.TokenBucketLimiter(
+        rate=1.0, burst=1.0, clock=clock, max_clients=10
+    )
+    for i in range(10):
+        limiter.consume(f"ip:{i}")
+    clock.now += 100.0
+
+    assert limiter.consume("ip:new") == 0.0
+    assert list(limiter._buckets) == ["ip:new"]
+
+
+def test_token_bucket_charges_large_requests_into_debt():
+    clock = FakeClock()
+    limiter = admission.TokenBucketLimiter(rate=1.0, burst=5.0, clock=clock)
+
+    assert limiter.consume("a", cost=20.0) == 0.0
+    assert limiter.consume("a") == 16.0
+    clock.now += 16.0
+    assert limiter.consume("a") == 0.0
+
+
+def test_request_cost_counts_strava_calls():
+    def scope(path: str, query: bytes = b"") -> dict:
+        return {"type": "http", "path": path, "query_string": query}
+
+    assert admission.request_cost(scope("/activities")) == 1.0
+    assert (
+        admission.request_cost(scope("/activities/analytics", b"ids=1&ids=2&ids=1"))
+        == 2.0
+    )
+    body = (
+        b'{"queries": [{"type": "activities"}, {"type": "analytics", "ids": [1, 2]},'
+        b' {"type": "analytics", "ids": [2, 3]}, {"type": "near", "lat": 0, "lng": 0}]}'
+    )
+    assert admission.request_cost(scope("/batch"), body) == 4.0
+    assert admission.request_cost(scope("/batch"), b"not json") == 1.0
+
+
+def test_middleware_charges_batch_per_stream_download(monkeypatch):
+    def failing_auth():
+        raise RuntimeError("no token")
+
+    monkeypatch.setattr(api, "get_authenticated_client", failing_auth)
+    config = admission.AdmissionConfig(rate_per_second=0.01, burst=10)
+    client = TestClient(api.create_app(admission_config=config))
+
+    resp = client.post(
+        "/batch",
+        json={"queries": [{"type": "analytics", "ids": list(range(1, 10))}]},
+    )
+    assert resp.status_code == 200
+    assert resp.json()["results"][0]["status_code"] == 500
+    assert client.get("/openapi.json").status_code == 200
+    assert client.get("/openapi.json").status_code == 429
+
+
+def test_request_priority_classifies_local_routes_as_cheap():
+    def scope(path: str) -> dict:
+        return {"type": "http", "path": path}
+
+    assert (
+        admission.request_priority(scope("/activities/near"))
+        == admission.PRIORITY_CHEAP
+    )
+    assert (
+        admission.request_priority(scope("/activities/12/similar"))
+        == admission.PRIORITY_CHEAP
+    )
+    assert admission.request_priority(scope("/activities")) == admission.PRIORITY_STRAVA
+    assert admission.request_priority(scope("/batch")) == admission.PRIORITY_STRAVA
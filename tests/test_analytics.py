@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from strava_customgpt_action import analytics
+
+
+@pytest.fixture(autouse=True)
+def _clear_cache():
+    analytics.clear_analytics_cache()
+    yield
+    analytics.clear_analytics_cache()
+
+
+def _streams(**series):
+    return {name: SimpleNamespace(data=list(values)) for name, values in series.items()}
+
+
+def test_compute_analytics_batch_time_in_zones():
+    config = analytics.ZoneConfig(heart_rate=(120.0, 150.0), power=(200.0,))
+    streams = {
+        1: {
+            "time": np.array([0.0, 10.0, 20.0, 30.0]),
+            "heartrate": np.array([110.0, 130.0, 160.0, 160.0]),
+        },
+        2: {
+            "time": np.array([0.0, 5.0, 10.0]),
+            "heartrate": np.array([100.0, 100.0, 100.0]),
+            "watts": np.array([180.0, 250.0, 250.0]),
+        },
+    }
+
+    first, second = analytics.compute_analytics_batch(streams, config)
+
+    assert first.hr_zone_seconds == [10.0, 10.0, 10.0]
+    assert first.power_zone_seconds is None
+    assert second.hr_zone_seconds == [10.0, 0.0, 0.0]
+    assert second.power_zone_seconds == [5.0, 5.0]
+
+
+def test_compute_splits_interpolates_boundaries():
+    streams = {
+        "time": np.array([0.0, 300.0, 600.0, 700.0]),
+        "distance": np.array([0.0, 1000.0, 2000.0, 2500.0]),
+        "heartrate": np.array([140.0, 150.0, 160.0, 170.0]),
+    }
+    dt = np.diff(streams["time"], append=streams["time"][-1])
+
+    splits = analytics.compute_splits(streams, dt, 1000.0)
+
+    assert [s.distance_m for s in splits] == [1000.0, 1000.0, 500.0]
+    assert [s.elapsed_time_s for s in splits] == [300.0, 300.0, 100.0]
+    assert splits[0].average_heartrate == pytest.approx(140.0)
+    assert splits[2].average_heartrate == pytest.approx(160.0)
+    assert splits[0].average_watts is None
+
+
+def test_get_activity_analytics_memoizes_per_zone_config(monkeypatch):
+    calls: list[int] = []
+
+    def fake_fetch(activity_id, types, client=None):
+        calls.append(activity_id)
+        return _streams(
+            time=[0, 10, 20], distance=[0, 50, 100], heartrate=[130, 130, None]
+        )
+
+    monkeypatch.setattr(analytics, "fetch_activity_streams", fake_fetch)
+
+    first = analytics.get_activity_analytics([7, 8])
+    again = analytics.get_activity_analytics([8, 7])
+    assert sorted(calls) == [7, 8]
+    assert again == [first[1], first[0]]
+
+    analytics.get_activity_analytics([7], analytics.ZoneConfig(split_unit="mi"))
+    assert sorted(calls) == [7, 7, 8]
+
+
+def test_zone_config_rejects_unsorted_bounds():
+    with pytest.raises(ValueError, match="strictly increasing"):
+        analytics.ZoneConfig(heart_rate=(150.0, 120.0))
+
+
+def test_compute_splits_tolerates_missing_and_backwards_distance():
+    streams = {
+        "time": np.array([0.0, 100.0, 200.0, 300.0, 400.0, 500.0]),
+        "distance": np.array([0.0, 500.0, np.nan, 450.0, 1200.0, np.nan]),
+        "heartrate": np.array([140.0, 140.0, 140.0, 140.0, 150.0, 150.0]),
+    }
+    dt = np.diff(streams["time"], append=streams["time"][-1])
+
+    splits = analytics.compute_splits(streams, dt, 1000.0)
+
+    assert [s.distance_m for s in splits] == [1000.0, 200.0]
+    assert splits[0].average_heartrate is not None
+
+
+def test_time_in_zones_ignores_paused_samples():
+    config = analytics.ZoneConfig(heart_rate=(150.0,))
+    time = np.array([0.0, 10.0, 1210.0, 1220.0])
+    heartrate = np.array([160.0, 160.0, 140.0, 140.0])
+
+    (with_moving,) = analytics.compute_analytics_batch(
+        {
+            1: {
+                "time": time,
+                "heartrate": heartrate,
+                "moving": np.array([0.0, 1.0, 0.0, 1.0]),
+            }
+        },
+        config,
+    )
+    (without_moving,) = analytics.compute_analytics_batch(
+        {2: {"time": time, "heartrate": heartrate}}, config
+    )
+
+    assert with_moving.hr_zone_seconds == [10.0, 10.0]
+    assert without_moving.hr_zone_seconds == [10.0, 40.0]
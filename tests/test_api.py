@@ -3,10 +3,13 @@ from __future__ import annotations
 from datetime import datetime, timedelta
 from types import SimpleNamespace
 
+import numpy as np
 import pytest
+import requests
 from fastapi.testclient import TestClient
+from stravalib.exc import ObjectNotFound, RateLimitExceeded
 
-from strava_customgpt_action import api
+from strava_customgpt_action import analytics, api, similarity
 
 
 def create_test_app():
@@ -33,7 +36,10 @@ def test_list_activities_success(monkeypatch):
     )
 
     monkeypatch.setattr(
-        api, "fetch_recent_activities", lambda limit: [sample_activity], raising=False
+        api,
+        "fetch_recent_activities",
+        lambda limit, client=None: [sample_activity],
+        raising=False,
     )
 
     client = create_test_app()
@@ -48,7 +54,7 @@ def test_list_activities_success(monkeypatch):
 
 
 def test_list_activities_handles_runtime_error(monkeypatch):
-    def _boom(limit: int):
+    def _boom(limit: int, client=None):
         raise RuntimeError("token expired")
 
     monkeypatch.setattr(api, "fetch_recent_activities", _boom, raising=False)
@@ -57,3 +63,355 @@ def test_list_activities_handles_runtime_error(monkeypatch):
     resp = client.get("/activities")
     assert resp.status_code == 500
     assert resp.json()["detail"] == "token expired"
+
+
+def test_activity_analytics_endpoint(monkeypatch):
+    captured = {}
+
+    def fake_analytics(activity_ids, config, client=None):
+        captured["ids"] = activity_ids
+        captured["config"] = config
+        return [
+            analytics.ActivityAnalytics(
+                activity_id=activity_ids[0],
+                hr_zone_seconds=[60.0, 120.0, 0.0],
+                power_zone_seconds=None,
+                splits=[
+                    analytics.Split(index=1, distance_m=1609.3, elapsed_time_s=480)
+                ],
+            )
+        ]
+
+    monkeypatch.setattr(api, "get_activity_analytics", fake_analytics, raising=False)
+
+    client = create_test_app()
+    resp = client.get(
+        "/activities/42/analytics?hr_zones=130&hr_zones=150&split_unit=mi"
+    )
+    assert resp.status_code == 200
+    body = resp.json()
+    assert captured["ids"] == [42]
+    assert captured["config"].heart_rate == (130.0, 150.0)
+    assert body["split_unit"] == "mi"
+    assert body["analytics"][0]["hr_zone_seconds"] == [60.0, 120.0, 0.0]
+    assert body["analytics"][0]["splits"][0]["elapsed_time_s"] == 480
+
+
+def test_activities_analytics_rejects_unsorted_zones():
+    client = create_test_app()
+    resp = client.get("/activities/analytics?ids=1&hr_zones=150&hr_zones=120")
+    assert resp.status_code == 422
+
+
+def test_activities_near_returns_indexed_activities(monkeypatch):
+    lake_run = SimpleNamespace(
+        id=7,
+        name="Lake loop",
+        start_latlng=SimpleNamespace(root=[45.8, 9.1]),
+        end_latlng=None,
+        map=SimpleNamespace(summary_polyline=None),
+    )
+    monkeypatch.setattr(
+        api,
+        "fetch_recent_activities",
+        lambda limit, client=None: [lake_run],
+        raising=False,
+    )
+
+    client = create_test_app()
+    listed = client.get("/activities").json()["activities"][0]
+    assert listed["start_latlng"] == [45.8, 9.1]
+
+    resp = client.get("/activities/near?lat=45.801&lng=9.1&radius=500")
+    assert resp.status_code == 200
+    body = resp.json()
+    assert body["indexed_activities"] == 1
+    assert body["activities"][0]["id"] == 7
+    assert body["activities"][0]["distance_from_point_m"] == pytest.approx(
+        111, rel=0.01
+    )
+    assert client.get("/activities/near?lat=0&lng=0").json()["activities"] == []
+
+
+def test_similar_activities_endpoint(monkeypatch):
+    index = similarity.WorkoutSimilarityIndex()
+    index.add(
+        [
+            {
+                "id": 1,
+                "sport_type": "Run",
+                "distance_m": 10_000,
+                "moving_time_s": 3_000,
+            },
+            {"id": 2, "sport_type": "Run", "distance_m": 9_800, "moving_time_s": 2_950},
+            {
+                "id": 3,
+                "sport_type": "Ride",
+                "distance_m": 50_000,
+                "moving_time_s": 6_000,
+            },
+        ]
+    )
+    client = TestClient(api.create_app(indexes=api.ActivityIndexes(similarity=index)))
+    resp = client.get("/activities/1/similar?k=1")
+    assert resp.status_code == 200
+    body = resp.json()
+    assert body["metric"] == "cosine"
+    assert [record["id"] for record in body["activities"]] == [2]
+
+    assert client.get("/activities/404/similar").status_code == 404
+
+
+def test_batch_resolves_auth_once_and_dedupes_fetches(monkeypatch):
+    auth_calls: list[int] = []
+    activity_limits: list[int] = []
+    stream_calls: list[int] = []
+    client_token = object()
+    analytics.clear_analytics_cache()
+
+    def fake_auth():
+        auth_calls.append(1)
+        return client_token
+
+    def fake_fetch(limit, client=None):
+        assert client is client_token
+        activity_limits.append(limit)
+        return [
+            SimpleNamespace(id=i, name=f"Run {i}", sport_type="Run")
+            for i in range(1, limit + 1)
+        ]
+
+    def fake_load_streams(activity_id, client=None):
+        assert client is client_token
+        stream_calls.append(activity_id)
+        return {
+            "time": np.array([0.0, 600.0]),
+            "distance": np.array([0.0, 2000.0]),
+        }
+
+    monkeypatch.setattr(api, "get_authenticated_client", fake_auth)
+    monkeypatch.setattr(api, "fetch_recent_activities", fake_fetch)
+    monkeypatch.setattr(api, "load_streams", fake_load_streams)
+
+    client = create_test_app()
+    resp = client.post(
+        "/batch",
+        json={
+            "queries": [
+                {"type": "activities", "limit": 2},
+                {"type": "activities", "limit": 3},
+                {"type": "analytics", "ids": [2, 1]},
+                {"type": "analytics", "ids": [1, 3]},
+                {"type": "analytics", "ids": [1], "hr_zones": [150, 120]},
+                {"type": "similar", "activity_id": 1, "k": 1},
+                {"type": "analytics", "ids": [1], "split_unit": "mi"},
+            ]
+        },
+    )
+    assert resp.status_code == 200
+    results = resp.json()["results"]
+
+    assert auth_calls == [1]
+    assert activity_limits == [3]
+    assert sorted(stream_calls) == [1, 2, 3]
+    assert [r["status_code"] for r in results] == [200, 200, 200, 200, 422, 200, 200]
+    assert len(results[2]["body"]["analytics"][0]["splits"]) == 2
+    assert len(results[6]["body"]["analytics"][0]["splits"]) == 2
+    assert results[6]["body"]["split_unit"] == "mi"
+    assert len(results[0]["body"]["activities"]) == 2
+    assert len(results[1]["body"]["activities"]) == 3
+    assert [a["activity_id"] for a in results[3]["body"]["analytics"]] == [1, 3]
+    assert "strictly increasing" in results[4]["detail"]
+    assert len(results[5]["body"]["activities"]) == 1
+
+
+def test_batch_reports_auth_failure_per_query(monkeypatch):
+    def failing_auth():
+        raise RuntimeError("STRAVA_REFRESH_TOKEN is missing")
+
+    monkeypatch.setattr(api, "get_authenticated_client", failing_auth)
+
+    client = create_test_app()
+    resp = client.post(
+        "/batch",
+        json={
+            "queries": [
+                {"type": "activities"},
+                {"type": "near", "lat": 45.0, "lng": 9.0},
+            ]
+        },
+    )
+    assert resp.status_code == 200
+    activities_result, near_result = resp.json()["results"]
+    assert activities_result["status_code"] == 500
+    assert "STRAVA_REFRESH_TOKEN" in activities_result["detail"]
+    assert near_result["status_code"] == 200
+    assert near_result["body"]["activities"] == []
+
+
+def _lake_runs(ids):
+    return [
+        SimpleNamespace(
+            id=i,
+            name=f"Lake run {i}",
+            sport_type="Run",
+            distance=10_000.0 + i,
+            moving_time=timedelta(minutes=50),
+            start_date=datetime(2020, 1, 1) + timedelta(days=i),
+            start_latlng=SimpleNamespace(root=[45.8, 9.1 + i * 1e-4]),
+        )
+        for i in ids
+    ]
+
+
+def test_sync_backfills_history_and_survives_restart(monkeypatch, history_file):
+    afters = []
+
+    def fake_pages(after, client=None):
+        afters.append(after)
+        if after is None:
+            yield _lake_runs(range(1, 101))
+            yield _lake_runs(range(101, 121))
+
+    monkeypatch.setattr(api, "iter_activity_pages", fake_pages)
+
+    client = create_test_app()
+    first = client.post("/activities/sync").json()
+    assert first == {"fetched": 120, "added": 120, "total": 120}
+    assert client.post("/activities/sync").json()["total"] == 120
+    assert afters[0] is None
+    assert afters[1] == datetime(2020, 4, 30)
+
+    # A fresh process reloads the persisted history into its own indexes.
+    restarted = create_test_app()
+    near = restarted.get("/activities/near?lat=45.8&lng=9.1001&radius=5&limit=200")
+    assert [a["id"] for a in near.json()["activities"]] == [1]
+    assert restarted.get("/activities/1/similar?k=3").status_code == 200
+    assert history_file.exists()
+
+
+def test_sync_keeps_completed_pages_when_rate_limited(monkeypatch):
+    afters = []
+
+    def fake_pages(after, client=None):
+        afters.append(after)
+        if after is None:
+            yield _lake_runs(range(1, 4))
+            raise RateLimitExceeded("Rate limit exceeded")
+        yield _lake_runs(range(4, 6))
+
+    monkeypatch.setattr(api, "iter_activity_pages", fake_pages)
+
+    client = create_test_app()
+    failed = client.post("/activities/sync")
+    assert failed.status_code == 503
+    assert failed.json()["detail"] == "Strava rate limit exceeded."
+
+    resumed = client.post("/activities/sync").json()
+    assert afters[1] == datetime(2020, 1, 4)
+    assert resumed == {"fetched": 2, "added": 2, "total": 5}
+
+
+def test_sync_maps_request_errors_to_502(monkeypatch):
+    def failing_pages(after, client=None):
+        raise requests.ConnectionError("connection reset")
+        yield []
+
+    monkeypatch.setattr(api, "iter_activity_pages", failing_pages)
+
+    resp = create_test_app().post("/activities/sync")
+    assert resp.status_code == 502
+    assert "connection reset" in resp.json()["detail"]
+
+
+def test_apps_do_not_share_indexes(monkeypatch):
+    monkeypatch.setattr(
+        api,
+        "fetch_recent_activities",
+        lambda limit, client=None: [
+            SimpleNamespace(id=7, start_latlng=SimpleNamespace(root=[45.8, 9.1]))
+        ],
+    )
+    first = create_test_app()
+    second = TestClient(api.create_app(history=api.ActivityHistory(None)))
+    assert first.get("/activities").status_code == 200
+
+    near = "/activities/near?lat=45.8&lng=9.1"
+    assert first.get(near).json()["indexed_activities"] == 1
+    assert second.get(near).json()["indexed_activities"] == 0
+
+
+def test_serialize_activity_converts_speed_quantities():
+    record = api._serialize_activity(
+        SimpleNamespace(
+            id=5,
+            distance=SimpleNamespace(num=5000),
+            average_speed=SimpleNamespace(num=3.2),
+            max_speed=4.5,
+            total_elevation_gain=12,
+        )
+    )
+    assert record["distance_m"] == 5000.0
+    assert record["average_speed_mps"] == pytest.approx(3.2)
+    assert record["max_speed_mps"] == pytest.approx(4.5)
+    assert record["total_elevation_gain_m"] == 12.0
+
+
+def test_batch_maps_upstream_errors_per_query(monkeypatch):
+    analytics.clear_analytics_cache()
+
+    def fake_load_streams(activity_id, client=None):
+        if activity_id == 999:
+            raise ObjectNotFound("Record Not Found")
+        raise requests.ConnectionError("connection reset")
+
+    monkeypatch.setattr(api, "get_authenticated_client", lambda: object())
+    monkeypatch.setattr(
+        api,
+        "fetch_recent_activities",
+        lambda limit, client=None: [SimpleNamespace(id=1, name="Ride")],
+    )
+    monkeypatch.setattr(api, "load_streams", fake_load_streams)
+
+    client = create_test_app()
+    resp = client.post(
+        "/batch",
+        json={
+            "queries": [
+                {"type": "activities", "limit": 1},
+                {"type": "analytics", "ids": [999]},
+                {"type": "analytics", "ids": [5]},
+            ]
+        },
+    )
+    assert resp.status_code == 200
+    results = resp.json()["results"]
+    assert [r["status_code"] for r in results] == [200, 404, 502]
+    assert results[0]["body"]["activities"][0]["id"] == 1
+    assert "connection reset" in results[2]["detail"]
+
+
+def test_batch_rejects_too_many_stream_downloads():
+    client = create_test_app()
+    resp = client.post(
+        "/batch",
+        json={
+            "queries": [
+                {"type": "analytics", "ids": list(range(1, 31))},
+                {"type": "analytics", "ids": list(range(21, 52))},
+            ]
+        },
+    )
+    assert resp.status_code == 422
+    assert "at most 50 distinct" in resp.text
+
+
+def test_activity_analytics_returns_404_for_unknown_activity(monkeypatch):
+    def missing(activity_ids, config, client=None):
+        raise ObjectNotFound("Record Not Found")
+
+    monkeypatch.setattr(api, "get_activity_analytics", missing)
+
+    client = create_test_app()
+    resp = client.get("/activities/999/analytics")
+    assert resp.status_code == 404
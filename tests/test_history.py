@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+from datetime import UTC, datetime
+
+from strava_customgpt_action.history import ActivityHistory
+
+
+def test_history_merges_and_persists_records(tmp_path):
+    path = tmp_path / "nested" / "history.json"
+    history = ActivityHistory(path)
+
+    assert (
+        history.merge(
+            [
+                {"id": 1, "start_date": "2024-05-01T06:00:00Z"},
+                {"id": 2, "start_date": "2024-05-03T06:00:00Z"},
+            ]
+        )
+        == 2
+    )
+    assert (
+        history.merge([{"id": 2, "start_date": "2024-05-03T06:00:00Z", "name": "x"}])
+        == 0
+    )
+
+    reloaded = ActivityHistory(path)
+    records = reloaded.load()
+    assert sorted(r["id"] for r in records) == [1, 2]
+    assert reloaded.latest_start_date() == datetime(2024, 5, 3, 6, tzinfo=UTC)
+
+
+def test_history_tolerates_missing_or_corrupt_file(tmp_path):
+    path = tmp_path / "history.json"
+    assert ActivityHistory(path).load() == []
+
+    path.write_text("{not json")
+    history = ActivityHistory(path)
+    assert history.load() == []
+    assert history.latest_start_date() is None
@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+from strava_customgpt_action import similarity
+
+
+def _activity(activity_id, sport, distance_m, moving_time_s, heartrate=None):
+    return {
+        "id": activity_id,
+        "sport_type": sport,
+        "distance_m": distance_m,
+        "moving_time_s": moving_time_s,
+        "average_heartrate": heartrate,
+        "total_elevation_gain_m": 0.1 * distance_m / 100,
+    }
+
+
+def test_activity_features_marks_missing_values_as_nan():
+    vector = similarity.activity_features(_activity(1, "TrailRun", 10_000, 3_000))
+
+    assert vector[0] == 1.0  # Run family one-hot
+    assert vector[: len(similarity.SPORT_FAMILIES) + 1].sum() == 1.0
+    assert np.isnan(vector).sum() == 3  # max speed, avg HR, max HR
+
+
+@pytest.mark.parametrize("metric", ["cosine", "l2"])
+def test_query_ranks_closest_workouts_first(metric):
+    index = similarity.WorkoutSimilarityIndex(capacity=2)
+    index.add(
+        [
+            _activity(1, "Run", 10_000, 3_000, 150),
+            _activity(2, "Run", 10_500, 3_100, 152),
+            _activity(3, "Run", 5_000, 1_800, 140),
+            _activity(4, "Ride", 60_000, 7_200, 130),
+        ]
+    )
+
+    (matches,) = index.query([1], k=2, metric=metric)
+
+    assert [record["id"] for record, _ in matches] == [2, 3]
+    assert len(index) == 4
+
+
+def test_query_batches_and_updates_incrementally():
+    index = similarity.WorkoutSimilarityIndex()
+    index.add([_activity(1, "Run", 10_000, 3_000), _activity(2, "Ride", 40_000, 5_000)])
+    index.add([_activity(3, "Ride", 41_000, 5_100)])
+
+    run_matches, ride_matches = index.query([1, 2], k=1)
+    assert ride_matches[0][0]["id"] == 3
+    assert run_matches[0][0]["id"] != 1
+
+    index.add([_activity(3, "Run", 10_100, 3_050)])
+    (matches,) = index.query([1], k=1)
+    assert matches[0][0]["id"] == 3
+    assert len(index) == 3
+
+
+def test_query_unknown_activity_raises_key_error():
+    index = similarity.WorkoutSimilarityIndex()
+    with pytest.raises(KeyError):
+        index.query([99])
@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+import time
+
+import numpy as np
+import pytest
+
+from strava_customgpt_action import spatial
+
+
+def test_decode_polylines_matches_reference_encoding():
+    tracks = spatial.decode_polylines(["_p~iF~ps|U_ulLnnqC_mqNvxq`@", "", "??"])
+
+    np.testing.assert_allclose(
+        tracks[0], [[38.5, -120.2], [40.7, -120.95], [43.252, -126.453]]
+    )
+    assert tracks[1].shape == (0, 2)
+    np.testing.assert_allclose(tracks[2], [[0.0, 0.0]])
+
+
+def test_track_distance_uses_segments_not_only_vertices():
+    track = np.array([[45.0, 7.0], [45.0, 7.2]])
+
+    # Midpoint of a ~15 km segment, far from either vertex.
+    assert spatial.track_distance_m(45.0, 7.1, track) == pytest.approx(0.0, abs=1e-6)
+    assert spatial.track_distance_m(45.001, 7.1, track) == pytest.approx(111, rel=0.01)
+
+
+def test_location_index_queries_nearby_activities():
+    index = spatial.ActivityLocationIndex()
+    index.add(
+        [
+            {"id": 1, "summary_polyline": "_p~iF~ps|U_ulLnnqC_mqNvxq`@"},
+            {"id": 2, "start_latlng": (45.0, 7.0), "end_latlng": (45.0, 7.0)},
+            {"id": 3},
+        ]
+    )
+    assert len(index) == 2
+
+    # Halfway along the first polyline segment: only reachable via densified cells.
+    matches = index.query(39.6, -120.575, 5_000)
+    assert [record["id"] for record, _ in matches] == [1]
+    assert index.query(45.0005, 7.0, 100)[0][0]["id"] == 2
+    assert index.query(0.0, 0.0, 10_000) == []
+
+
+def test_location_index_reinsert_replaces_previous_track():
+    index = spatial.ActivityLocationIndex()
+    index.add([{"id": 5, "start_latlng": (10.0, 10.0)}])
+    index.add([{"id": 5, "start_latlng": (20.0, 20.0)}])
+
+    assert index.query(10.0, 10.0, 1_000) == []
+    assert index.query(20.0, 20.0, 1_000)[0][0]["id"] == 5
+
+
+def test_location_index_query_at_pole_is_bounded():
+    index = spatial.ActivityLocationIndex()
+    index.add(
+        [
+            {"id": 1, "start_latlng": (89.9, 45.0)},
+            {"id": 2, "start_latlng": (45.0, 7.0)},
+        ]
+    )
+
+    started = time.perf_counter()
+    matches = index.query(90.0, 0.0, 50_000)
+    assert time.perf_counter() - started < 1.0
+    assert [record["id"] for record, _ in matches] == [1]
+
+
+def test_location_index_query_across_antimeridian():
+    index = spatial.ActivityLocationIndex()
+    index.add(
+        [
+            {"id": 1, "start_latlng": (-16.5, 179.999)},
+            # A route crossing the antimeridian must not span the whole globe.
+            {"id": 2, "start_latlng": (10.0, 179.99), "end_latlng": (10.0, -179.99)},
+        ]
+    )
+
+    assert [r["id"] for r, _ in index.query(-16.5, -179.999, 1_000)] == [1]
+    assert [r["id"] for r, _ in index.query(10.0, 180.0, 500)] == [2]
+    assert index.query(10.0, 0.0, 10_000) == []
+
+
+def test_decode_polylines_drops_malformed_input_only():
+    good = "_p~iF~ps|U_ulLnnqC_mqNvxq`@"
+    tracks = spatial.decode_polylines(
+        [
+            good[:-2],  # odd value count
+            good[:-1],  # last chunk still carries the continuation bit
+            "_p~iF~ps|U é",  # non-ASCII
+            "_p~iF ~ps|U",  # character below the encoding range
+            good,
+        ]
+    )
+
+    assert [t.shape for t in tracks[:4]] == [(0, 2)] * 4
+    np.testing.assert_allclose(tracks[4][0], [38.5, -120.2])
+
+
+def test_location_index_falls_back_to_endpoints_for_bad_polyline():
+    index = spatial.ActivityLocationIndex()
+    index.add(
+        [
+            {
+                "id": 1,
+                "summary_polyline": "_p~iF~ps|U_ulLnnqC_mqNvxq",
+                "start_latlng": (45.0, 7.0),
+            }
+        ]
+    )
+
+    assert index.query(45.0, 7.0, 100)[0][0]["id"] == 1